@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*
+"""
+Steps/sec of each Navier_Stokes backend, and how far each drifts from the
+reference 'convolve' chain.
+
+Run from the repository root:
+    python -m benchmarks.backends --sizes 256 1024 4096
+"""
+import argparse
+import time
+
+import numpy as np
+from solvers import NavierStokes
+from solvers.backends import BACKENDS
+
+
+def steps_per_second(solver, min_time=1.):
+    """Step `solver` for at least `min_time` seconds and return steps/sec."""
+    solver.step()  #warm up
+    steps = 0
+    start = time.perf_counter()
+    while True:
+        solver.step()
+        steps += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return steps / elapsed
+
+def drift(backend, size, steps=20):
+    """Max absolute difference from the reference backend after `steps`."""
+    reference = NavierStokes((size, size)).step(steps)
+    other = NavierStokes((size, size), backend=backend).step(steps)
+    return max(np.abs(reference.momentum - other.momentum).max(),
+               np.abs(reference.pressure - other.pressure).max())
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[256, 1024, 4096])
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS))
+    parser.add_argument('--min-time', type=float, default=1.)
+    args = parser.parse_args()
+
+    print('{:>6} {:>10} {:>12} {:>8} {:>10}'.format('size', 'backend',
+                                                     'steps/sec', 'speedup',
+                                                     'drift'))
+    for size in args.sizes:
+        baseline = None
+        for backend in args.backends:
+            solver = NavierStokes((size, size), backend=backend)
+            rate = steps_per_second(solver, args.min_time)
+            baseline = baseline or rate
+            print('{:>6} {:>10} {:>12.2f} {:>7.2f}x {:>10.2e}'.format(
+                  size, backend, rate, rate / baseline,
+                  drift(backend, min(size, 256))))
+
+
+if __name__ == '__main__':
+    main()
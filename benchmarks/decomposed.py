@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*
+"""
+Steps/sec of the decomposed Navier_Stokes backend against the number of
+worker processes, with the single process 'fused' backend as the baseline.
+
+Run from the repository root:
+    python -m benchmarks.decomposed --size 8192 --workers 1 2 4 8 16 32
+"""
+import argparse
+import os
+from functools import partial
+
+from solvers import NavierStokes
+from solvers.decomposed import DecomposedBackend
+from .backends import steps_per_second
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=4096)
+    parser.add_argument('--workers', type=int, nargs='+',
+                        default=[2 ** i for i in
+                                 range(os.cpu_count().bit_length())])
+    parser.add_argument('--min-time', type=float, default=2.)
+    args = parser.parse_args()
+
+    size = args.size, args.size
+    baseline = steps_per_second(NavierStokes(size, backend='fused'),
+                                args.min_time)
+    print('{:>8} {:>12} {:>8} {:>11}'.format('workers', 'steps/sec', 'speedup',
+                                             'efficiency'))
+    print('{:>8} {:>12.2f} {:>7.2f}x {:>11}'.format('fused', baseline, 1, '-'))
+    for workers in args.workers:
+        backend = partial(DecomposedBackend, workers=workers)
+        solver = NavierStokes(size, backend=backend)
+        rate = steps_per_second(solver, args.min_time)
+        solver.close()
+        speedup = rate / baseline
+        print('{:>8} {:>12.2f} {:>7.2f}x {:>10.0%}'.format(workers, rate,
+                                                          speedup,
+                                                          speedup / workers))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*
+"""
+V-cycles the multigrid pressure solver takes per step on odd-sized grids.
+
+An odd side can't simply be halved, and coarse grids whose edges don't line
+up with the fine grid's converge slowly, bc='constant' worst of all.  Each
+case pokes the grid, steps it and records the most cycles any step took;
+square power of two grids are the baseline.  Exits non-zero if a case takes
+more than `--max-cycles` or doesn't converge.
+
+Run from the repository root:
+    python -m benchmarks.multigrid --steps 10
+"""
+import argparse
+import sys
+import warnings
+
+from solvers import NavierStokes
+
+SIZES = (256, 256), (513, 257), (129, 257), (33, 65)  #(width, height)
+BCS = 'wrap', 'reflect', 'constant', 'nearest', 'mirror'
+
+
+def cycles(size, bc, steps):
+    """The most cycles a step took, and whether every step converged."""
+    solver = NavierStokes(size, bc=bc, backend='fused',
+                          pressure_solver='multigrid')
+    width, height = size
+    solver.poke(width // 4, height // 3)
+    most, converged = 0, True
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for _ in range(steps):
+            solver.step()
+            most = max(most, solver._pressure_solver.cycles)
+            converged &= solver._pressure_solver.converged
+    return most, converged
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--max-cycles', type=int, default=6)
+    args = parser.parse_args()
+
+    print('{:<12} {}'.format('size', ' '.join('{:>9}'.format(bc)
+                                               for bc in BCS)))
+    failed = False
+    for size in SIZES:
+        row = []
+        for bc in BCS:
+            most, converged = cycles(size, bc, args.steps)
+            slow = most > args.max_cycles or not converged
+            failed |= slow
+            row.append('{:>9}'.format('{}{}'.format(most, ' SLOW' if slow
+                                                    else '')))
+        print('{:<12} {}'.format('{}x{}'.format(*size), ' '.join(row)))
+    if failed:
+        sys.exit("multigrid took more than {} cycles".format(
+            args.max_cycles))
+
+
+if __name__ == '__main__':
+    main()
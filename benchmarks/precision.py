@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*
+"""
+How far the Navier_Stokes fields drift from a float64 reference run at each
+precision: float32, and float32 compute over float16 storage.
+
+Run from the repository root:
+    python -m benchmarks.precision --size 256 --steps 1000 --every 100
+"""
+import argparse
+
+import numpy as np
+from solvers import NavierStokes
+
+PRECISIONS = {'float32': {'dtype': np.float32},
+              'float16 storage': {'dtype': np.float32, 'storage': np.float16}}
+FIELDS = 'momentum', 'pressure'
+
+
+def drift(reference, solver):
+    """{field: (max absolute, max relative) difference from `reference`}."""
+    result = {}
+    for name in FIELDS:
+        expected = getattr(reference, name)
+        error = np.abs(getattr(solver, name) - expected).max()
+        scale = np.abs(expected).max()
+        result[name] = error, error / scale if scale else 0.
+    return result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--steps', type=int, default=1000)
+    parser.add_argument('--every', type=int, default=100)
+    parser.add_argument('--backend', default='convolve')
+    parser.add_argument('--pressure-solver', default='relax')
+    args = parser.parse_args()
+
+    def make(**kwargs):
+        return NavierStokes((args.size, args.size), backend=args.backend,
+                            pressure_solver=args.pressure_solver, **kwargs)
+    reference = make(dtype=np.float64)
+    solvers = {name: make(**kwargs) for name, kwargs in PRECISIONS.items()}
+
+    print('{:>6} {:>16} {:>12} {:>10} {:>12} {:>10}'.format(
+          'step', 'precision', 'momentum', 'relative', 'pressure',
+          'relative'))
+    with np.errstate(all='ignore'):
+        for _ in range(args.steps // args.every):
+            reference.step(args.every)
+            for name, solver in solvers.items():
+                solver.step(args.every)
+                errors = drift(reference, solver)
+                print('{:>6} {:>16} {:>12.3e} {:>10.3e} {:>12.3e} {:>10.3e}'
+                      .format(reference.steps, name, *errors['momentum'],
+                              *errors['pressure']))
+    for solver in [reference, *solvers.values()]:
+        solver.close()
+
+
+if __name__ == '__main__':
+    main()
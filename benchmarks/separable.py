@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*
+"""
+Speed and equivalence of separable.convolve against nd.convolve for every 2D
+kernel in the repository.
+
+Run from the repository root:
+    python -m benchmarks.separable --size 1024
+"""
+import argparse
+import time
+
+import numpy as np
+import scipy.ndimage as nd
+from solvers import NavierStokes, separable
+from solvers.backends import con_kernel, dif_kernel, poi_kernel, shift_kernel
+from solvers.two_dimensional import Diffusion2D
+from solvers.stencil import ADVECTION, AVERAGE, CONVECTION, SMOOTHING
+
+KERNELS = {'con_kernel': con_kernel,
+           'dif_kernel': dif_kernel,
+           'poi_kernel': poi_kernel,
+           'shift_kernel': shift_kernel,
+           'flow_kernel': NavierStokes((8, 8)).flow_kernel,
+           'Diffusion2D.kernel': Diffusion2D.kernel,
+           'Laplace2D': np.array([[0, 1, 0], [1, 0, 1], [0, 1, 0]]),
+           'stencil.AVERAGE': AVERAGE[2],
+           'stencil.CONVECTION': CONVECTION[2],
+           'stencil.SMOOTHING': SMOOTHING[2],
+           'stencil.ADVECTION': ADVECTION[2]}
+MODES = 'wrap', 'reflect', 'mirror', 'nearest', 'constant'
+
+
+def seconds(function, min_time):
+    """Mean seconds per call of `function`, over at least `min_time`."""
+    function()  #warm up
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        function()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / calls
+
+def error(kernel, field):
+    """Max difference from nd.convolve over every mode, in ulps of 1."""
+    reference_kernel = np.asarray(kernel).astype(field.dtype)
+    worst = 0.
+    for mode in MODES:
+        expected = nd.convolve(field, reference_kernel, mode=mode)
+        result = separable.convolve(field, kernel, mode)
+        assert result.dtype == field.dtype and result.shape == field.shape
+        worst = max(worst, np.abs(result - expected).max())
+    return worst / np.finfo(field.dtype).eps
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=1024)
+    parser.add_argument('--dtype', default='float32')
+    parser.add_argument('--min-time', type=float, default=.5)
+    args = parser.parse_args()
+
+    field = np.random.default_rng(0).random((args.size, args.size))
+    field = field.astype(args.dtype)
+    print('{:<20} {:>16} {:>10} {:>10} {:>8} {:>8}'.format(
+          'kernel', 'form', 'nd ms', 'sep ms', 'speedup', 'ulps'))
+    for name, kernel in KERNELS.items():
+        decomposed = separable.decomposition(kernel)
+        full = np.asarray(kernel).astype(field.dtype)
+        before = seconds(lambda: nd.convolve(field, full, mode='wrap'),
+                         args.min_time)
+        after = seconds(lambda: separable.convolve(field, kernel, 'wrap'),
+                        args.min_time)
+        print('{:<20} {:>16} {:>10.2f} {:>10.2f} {:>7.2f}x {:>8.1f}'.format(
+              name, decomposed.kind if decomposed else '-', before * 1e3,
+              after * 1e3, before / after, error(kernel, field)))
+
+
+if __name__ == '__main__':
+    main()
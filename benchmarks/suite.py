@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*
+"""
+Steps/sec, ns/cell and peak memory of every solver's update step, over grid
+sizes and dtypes.
+
+Sizes are side lengths: 2D solvers get size x size grids and 1D solvers
+size**2 cells, so ns/cell compares across the two.  Peak memory is what
+tracemalloc sees allocated on top of the solver's own state during a few
+steps (numpy reports its allocations to tracemalloc), measured in a separate
+run so tracing doesn't distort the timings.  A dtype may be given as
+compute/storage, e.g. float32/float16, which only NavierStokes runs.  A
+benchmark whose fields ended up another dtype than asked for is labeled e.g.
+"float64 (as float32)".
+
+Results can be saved as JSON and compared with an earlier run, e.g.:
+    python -m benchmarks.suite --output before.json
+    python -m benchmarks.suite --compare before.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from functools import partial
+
+import numpy as np
+import scipy
+from solvers import (NavierStokes, Diffusion1D, Burgers1D,
+                     NonlinearConvection1D, Burgers2D, Convection2D,
+                     Diffusion2D, Laplace2D, NonlinearConvection2D, Poisson2D)
+from .backends import steps_per_second
+
+ONE_DIMENSIONAL = Diffusion1D, Burgers1D, NonlinearConvection1D
+TWO_DIMENSIONAL = (Burgers2D, Convection2D, Diffusion2D, Laplace2D,
+                   NonlinearConvection2D, Poisson2D)
+
+
+def cases(sizes, dtypes, backends):
+    """(name, backend, size, dtype, make solver) of every benchmark."""
+    for size in sizes:
+        for dtype in dtypes:
+            dtype, _, storage = dtype.partition('/')
+            for backend in backends:
+                yield ('NavierStokes', backend, size, storage or dtype,
+                       partial(NavierStokes, (size, size), backend=backend,
+                               dtype=dtype, storage=storage or None))
+            if storage:
+                continue
+            for equation in ONE_DIMENSIONAL:
+                yield (equation.__name__, None, size, dtype,
+                       partial(equation, size * size, dtype=dtype))
+            for equation in TWO_DIMENSIONAL:
+                yield (equation.__name__, None, size, dtype,
+                       partial(equation, (size, size), dtype=dtype))
+
+def peak_memory(solver, steps=3):
+    """Peak bytes allocated while stepping, beyond what was already held."""
+    solver.step()  #warm up caches, buffers and compiled kernels
+    tracemalloc.start()
+    try:
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        solver.step(steps)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak - current
+
+def run(sizes, dtypes, backends, min_time):
+    results = []
+    for name, backend, size, dtype, make in cases(sizes, dtypes, backends):
+        with np.errstate(all='ignore'):  #some demos blow up; that's fine
+            solver = make()
+            rate = steps_per_second(solver, min_time)
+            field = getattr(solver, solver.fields[0])
+            peak = peak_memory(make())
+        results.append({'solver': name, 'backend': backend, 'size': size,
+                        'dtype': dtype, 'stepped_dtype': str(field.dtype),
+                        'cells': field.size,
+                        'steps_per_second': rate,
+                        'ns_per_cell': 1e9 / (rate * field.size),
+                        'peak_bytes': peak})
+        if hasattr(solver, 'close'):
+            solver.close()
+    return results
+
+def key(result):
+    return result['solver'], result['backend'], result['size'], result['dtype']
+
+def label(result):
+    text = ' '.join(str(value) for value in key(result) if value is not None)
+    if result['stepped_dtype'] != result['dtype']:
+        text += ' (as {})'.format(result['stepped_dtype'])
+    return text
+
+def report(results):
+    print('{:<42} {:>12} {:>9} {:>10}'.format('benchmark', 'steps/sec',
+                                              'ns/cell', 'peak MiB'))
+    for result in results:
+        print('{:<42} {:>12.2f} {:>9.3f} {:>10.2f}'.format(
+              label(result), result['steps_per_second'],
+              result['ns_per_cell'], result['peak_bytes'] / 2**20))
+
+def compare(results, baseline, threshold):
+    """
+    Print each benchmark's speed relative to `baseline`; returns the labels
+    of those more than `threshold` slower.
+    """
+    before = {key(result): result for result in baseline}
+    regressions = []
+    print('{:<42} {:>12} {:>12} {:>8} {:>12}'.format(
+          'benchmark', 'before', 'after', 'speed', 'peak MiB'))
+    for result in results:
+        old = before.get(key(result))
+        if old is None:
+            continue
+        speed = result['steps_per_second'] / old['steps_per_second']
+        flag = ''
+        if speed < 1 - threshold:
+            flag = '  <-- slower'
+            regressions.append(label(result))
+        print(('{:<42} {:>12.2f} {:>12.2f} {:>7.2f}x '
+               '{:>5.1f}->{:<5.1f}{}').format(
+              label(result), old['steps_per_second'],
+              result['steps_per_second'], speed, old['peak_bytes'] / 2**20,
+              result['peak_bytes'] / 2**20, flag))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[256, 1024])
+    parser.add_argument('--dtypes', nargs='+', default=['float32', 'float64'])
+    parser.add_argument('--backends', nargs='+', default=['convolve', 'fused'],
+                        help='NavierStokes backends to run')
+    parser.add_argument('--min-time', type=float, default=.5)
+    parser.add_argument('--output', help='save the results to this .json file')
+    parser.add_argument('--compare', help='compare against the results in '
+                                          'this .json file')
+    parser.add_argument('--threshold', type=float, default=.1,
+                        help='slowdown that counts as a regression')
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.dtypes, args.backends, args.min_time)
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+        regressions = compare(results, baseline, args.threshold)
+    else:
+        report(results)
+        regressions = []
+
+    if args.output:
+        machine = {'python': sys.version.split()[0],
+                   'numpy': np.__version__,
+                   'scipy': scipy.__version__,
+                   'platform': platform.platform(),
+                   'processor': platform.processor(),
+                   'time': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        with open(args.output, 'w') as file:
+            json.dump({'machine': machine, 'results': results}, file,
+                      indent=4)
+    if regressions:
+        sys.exit('{} regression(s): {}'.format(len(regressions),
+                                               ', '.join(regressions)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*
+"""
+Equivalence and speed of the active-tile Navier_Stokes backend against the
+full-grid 'fused' one.
+
+With threshold=0 every step must be bit-identical to 'fused': each case
+pokes a sparse grid, optionally paints walls, steps both backends and
+compares momentum and pressure after every `--check-every` steps.  Cases
+cover every bc, with and without walls, zero external flow and an ensemble.
+Exits non-zero on any difference.
+
+Run from the repository root:
+    python -m benchmarks.tiled --size 256 --steps 200
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+from solvers import NavierStokes
+
+BCS = 'wrap', 'reflect', 'constant', 'nearest', 'mirror'
+
+
+def cases():
+    """(name, NavierStokes kwargs, walls) of every case checked."""
+    for bc in BCS:
+        for walls in False, True:
+            yield '{} walls={}'.format(bc, walls), {'bc': bc}, walls
+    yield 'wrap external_flow=0', {'external_flow': 0.}, True
+    yield 'wrap batch=2', {'batch': 2, 'external_flow': [.4, .1]}, True
+
+def prepare(size, kwargs, walls, backend):
+    solver = NavierStokes(size, backend=backend, **kwargs)
+    #Start from still water with a couple of pokes, so most tiles are dead.
+    solver.momentum[...] = 0
+    solver.pressure[...] = 0
+    width, height = size
+    solver.poke(width // 4, height // 3)
+    solver.poke(3 * width // 4, 2 * height // 3)
+    if walls:
+        solver.add_wall(width // 2, height // 2)
+        solver.add_wall(width // 2 + 8, height // 2)
+    return solver
+
+def check(size, kwargs, walls, steps, check_every):
+    """Max difference between the backends, and each one's seconds/step."""
+    fused = prepare(size, kwargs, walls, 'fused')
+    tiled = prepare(size, kwargs, walls, 'tiled')
+    worst = 0.
+    seconds = {'fused': 0., 'tiled': 0.}
+    for _ in range(0, steps, check_every):
+        for name, solver in ('fused', fused), ('tiled', tiled):
+            start = time.perf_counter()
+            solver.step(check_every)
+            seconds[name] += time.perf_counter() - start
+        for field in 'momentum', 'pressure':
+            difference = np.abs(getattr(fused, field) -
+                                getattr(tiled, field)).max()
+            worst = max(worst, float(difference))
+    fused.close()
+    tiled.close()
+    return worst, seconds['fused'] / steps, seconds['tiled'] / steps
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, default=256)
+    parser.add_argument('--steps', type=int, default=200)
+    parser.add_argument('--check-every', type=int, default=10)
+    args = parser.parse_args()
+
+    size = args.size, args.size
+    print('{:<24} {:>12} {:>10} {:>10} {:>8}'.format(
+          'case', 'max diff', 'fused ms', 'tiled ms', 'speedup'))
+    failed = False
+    for name, kwargs, walls in cases():
+        worst, fused, tiled = check(size, kwargs, walls, args.steps,
+                                    args.check_every)
+        failed |= worst != 0
+        print('{:<24} {:>12.3g} {:>10.2f} {:>10.2f} {:>7.2f}x{}'.format(
+              name, worst, fused * 1e3, tiled * 1e3, fused / tiled,
+              '' if worst == 0 else '  MISMATCH'))
+    if failed:
+        sys.exit("tiled steps differ from fused ones")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,87 +2,131 @@
 """
 Kivy implementation of 2D Navier_Stokes.
 
-Note that boundary conditions(bcs) and external flow are 'hacked'.  To properly
-account for bcs one should 'roll' the arrays by hand instead of using scipy's
-convolve.  It's doubtful the accuracy is worth the overall slowdown of the
-updates though.
+This is only a viewer; the simulation itself lives in solvers/navier_stokes.py.
 
 click to displace fluid
+right-click to draw walls
 'r' to reset
+'s' to save a checkpoint (if `checkpoint` is set)
+'p' to show per-stage timings
 """
+import os
+from contextlib import nullcontext
+
 import numpy as np
-import scipy.ndimage as nd
 from kivy.config import Config
 Config.set('input', 'mouse', 'mouse,multitouch_on_demand')
 from kivy.app import App
 from kivy.uix.widget import Widget
+from kivy.uix.label import Label
 from kivy.clock import Clock
 from kivy.graphics.texture import Texture
 from kivy.graphics import Rectangle
 from kivy.core.window import Window
-
-texture_dim = [256, 256]
+from solvers import NavierStokes
+from solvers.checkpoint import Checkpointer, load, save
+from solvers.profiling import Profiler
+from solvers.record import Recorder
+from solvers.render import Framebuffer, pressure_colors
+from solvers.runner import SimulationThread, Substepper
+
+texture_dim = [256, 256]  #simulation resolution
+downsample = 1  #show each downsample x downsample block of cells as one texel
 #boundary condition - 'wrap', 'reflect', 'constant', 'nearest', 'mirror'
 bc = "wrap"
 viscosity = .018  #Is it odd that negative viscosity still works?
 rho = 1.06  #Density
 damping = .994  #Breaks conservation, but behavior is more river-like
 external_flow = .4  #flow in the horizontal direction -- this is a hack
-
-#drop just makes pokes look a little better
-drop = np.array([[0., 0., 1., 1., 1., 1., 1., 0., 0.],
-                 [0., 1., 1., 1., 1., 1., 1., 1., 0.],
-                 [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-                 [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-                 [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-                 [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-                 [1., 1., 1., 1., 1., 1., 1., 1., 1.],
-                 [0., 1., 1., 1., 1., 1., 1., 1., 0.],
-                 [0., 0., 1., 1., 1., 1., 1., 0., 0.],])
-
-red = np.zeros(texture_dim, dtype=np.float32).T
-green = np.full(texture_dim, .6549, dtype=np.float32).T
-
-#convective kernel
-con_kernel = np.array([[   0, .25,    0],
-                       [ .25,  -1,  .25],
-                       [   0, .25,    0]])
-#diffusion kernel
-dif_kernel = np.array([[.025,  .1, .025],
-                       [  .1,  .5,   .1],
-                       [.025,  .1, .025]])
-#poisson kernel
-poi_kernel = np.array([[   0, .25,    0],
-                       [ .25,   0,  .25],
-                       [   0, .25,    0]])
-flow_kernal = np.array([[0, 0, 0],
-                        [-external_flow, 1, external_flow],
-                        [0, 0, 0]])
+backend = "fused"  #see solvers/backends.py
+pressure_solver = "relax"  #'relax', 'multigrid' or 'fft' (needs bc = "wrap")
+#directory to restore from at start and save to, e.g. "run.ckpt"
+checkpoint = None
+checkpoint_every = 1000  #steps between automatic checkpoints
+#directory to stream pressure and momentum into, e.g. "run.frames"
+record = None
+record_every = 10  #steps between recorded frames
+#solver steps per drawn frame; the solver runs in its own thread
+steps_per_frame = 1
+#real-time physics rate, adapted per frame; None to use steps_per_frame
+steps_per_second = 120
+#CFL-like cap on steps per frame: max|momentum| * steps
+max_cells_per_frame = 8.
+frame_budget = 1 / 60  #most wall time spent stepping per frame
+
+def draw(solver, framebuffer):
+    with solver.stage('draw'):
+        framebuffer.draw(solver.pressure, solver.wall_index.index)
 
 class Display(Widget):
     def __init__(self, **kwargs):
         super(Display, self).__init__(**kwargs)
-        self.texture = Texture.create(size=texture_dim)
+        if checkpoint and os.path.exists(checkpoint):
+            self.solver = load(checkpoint, backend=backend)
+        else:
+            self.solver = NavierStokes(texture_dim, bc=bc, viscosity=viscosity,
+                                       rho=rho, damping=damping,
+                                       external_flow=external_flow,
+                                       backend=backend,
+                                       pressure_solver=pressure_solver)
+        if checkpoint:
+            self.solver.hooks.append(Checkpointer(checkpoint,
+                                                  checkpoint_every))
+        self.recorder = record and Recorder(record, record_every)
+        if self.recorder:
+            self.solver.hooks.append(self.recorder)
+        #pressure_colors stops changing below -1 (blue is 0) and above
+        #1 / .6549 (green is 1)
+        framebuffers = [Framebuffer(self.solver.shape, pressure_colors,
+                                    lo=-1., hi=1 / .6549, factor=downsample)
+                        for _ in range(2)]
+        height, width = framebuffers[0].shape
+        self.texture = Texture.create(size=(width, height))
         with self.canvas:
             self.rect = Rectangle(texture=self.texture, pos=self.pos,
                                   size=(self.width, self.height))
         self.bind(size=self._update_rect, pos=self._update_rect)
         self._keyboard = Window.request_keyboard(self._keyboard_closed, self)
         self._keyboard.bind(on_key_down=self._on_keyboard_down)
-        self.reset()
+        substepper = steps_per_second and Substepper(steps_per_second,
+                                                     max_cells_per_frame,
+                                                     frame_budget)
+        self.simulation = SimulationThread(self.solver, draw, framebuffers,
+                                           steps_per_frame,
+                                           substepper).start()
+        self.shown = 0  #last frame blitted
+        self.poke_touches = []  #since the last frame, as solver cells
+        self.wall_touches = []
+        self.profiler = Profiler()
+        self.overlay = None
 
     def reset(self):
-        self.momentum = np.zeros(texture_dim, dtype=np.float32).T
-        self.momentum[3 * texture_dim[0] // 8 : 5 * texture_dim[0] // 8,
-                      3 * texture_dim[1] // 8 : 5 * texture_dim[1] // 8] = .04
-        self.pressure = np.zeros(texture_dim, dtype=np.float32).T
-        self.pressure[3 * texture_dim[0] // 8 : 5 * texture_dim[0] // 8,
-                      3 * texture_dim[1] // 8 : 5 * texture_dim[1] // 8] = 1
-        self.walls = np.zeros(texture_dim, dtype=np.float32).T
+        self.simulation.call(self.solver.reset)
 
     def _update_rect(self, *args):
         self.rect.size = self.size
         self.rect.pos = self.pos
+        if self.overlay:
+            self.overlay.pos = self.pos
+            self.overlay.size = self.overlay.text_size = self.size
+
+    def toggle_profiler(self):
+        if self.overlay:
+            self.solver.profiler = None
+            self.refresh.cancel()
+            self.remove_widget(self.overlay)
+            self.overlay = None
+            return
+        self.profiler.reset()
+        self.solver.profiler = self.profiler
+        self.overlay = Label(pos=self.pos, size=self.size, text_size=self.size,
+                             halign='left', valign='top',
+                             font_name='RobotoMono-Regular')
+        self.add_widget(self.overlay)
+        self.refresh = Clock.schedule_interval(self._refresh_overlay, .5)
+
+    def _refresh_overlay(self, dt):
+        self.overlay.text = self.profiler.report()
 
     def _keyboard_closed(self):
         self._keyboard.unbind(on_key_down=self._on_keyboard_down)
@@ -91,53 +135,49 @@ class Display(Widget):
     def _on_keyboard_down(self, keyboard, keycode, text, modifiers):
         if keycode[1] == 'r':
             self.reset()
+        elif keycode[1] == 's' and checkpoint:
+            self.simulation.call(save, self.solver, checkpoint)
+        elif keycode[1] == 'p':
+            self.toggle_profiler()
         return True
 
     def update(self, dt):
-        self.momentum = (  nd.convolve(self.momentum, dif_kernel, mode=bc)
-                         - (  viscosity * self.momentum
-                            * nd.convolve(self.momentum, con_kernel, mode=bc))
-                         + nd.convolve(self.pressure, con_kernel, mode=bc) * rho)
-        self.momentum *= damping
-
-        if external_flow:
-            self.momentum = nd.convolve(self.momentum, flow_kernal, mode=bc)
-
-        #dif for difference, not diffusion -- dif is the change in momentum
-        dif = nd.convolve(self.momentum, poi_kernel, mode=bc)
-
-        self.pressure = ((nd.convolve(self.pressure, poi_kernel, mode=bc) +
-                        rho / 2 * (dif - dif**2)) * damping)
-
-        #Wall boundary conditions
-        self.momentum = np.where(self.walls !=1, self.momentum, -external_flow)
-        self.pressure = np.where(self.walls !=1, self.pressure, 0)
-
-        #Blit
-        RGB = np.dstack([red, green * self.pressure, (self.pressure + 1) * .5])
-        RGB[self.walls == 1] = np.array([.717, .176, .07])
-        self.texture.blit_buffer(RGB.tobytes(), colorfmt='rgb',
-                                 bufferfmt='float')
+        self.simulation.check()
+        self._send_touches()
+        if self.simulation.frame == self.shown:
+            return True
+
+        #Blit the latest frame the simulation thread has finished.
+        profiling = self.overlay is not None
+        with self.profiler.stage('blit') if profiling else nullcontext():
+            with self.simulation.latest() as framebuffer:
+                self.shown = self.simulation.frame
+                self.texture.blit_buffer(framebuffer.pixels, colorfmt='rgb',
+                                         bufferfmt='ubyte')
         self.canvas.ask_update()
         return True
 
     def poke(self, touch):
-        scaled_x = int(touch.x * texture_dim[0] / self.width)
-        scaled_y = int(touch.y * texture_dim[1] / self.height)
-        try:
-            if touch.button == "left":
-                self.pressure[scaled_y - 4:scaled_y + 5,
-                              scaled_x - 4:scaled_x + 5][drop == 1] = 1.
-                self.momentum[scaled_y - 4:scaled_y + 5,
-                              scaled_x - 4:scaled_x + 5][drop == 1] = 0.
-            if touch.button == "right":
-                self.walls[scaled_y - 4:scaled_y + 5,
-                           scaled_x - 4:scaled_x + 5][drop == 1] = 1
-        except:
-            #Too close to border.
-            pass
+        #Touches land on the (maybe downsampled) texture; poke the solver's
+        #own grid.  They're only queued here and go to the simulation in one
+        #batch per frame, however many events a fast drag makes.
+        size = self.solver.size
+        scaled_x = int(touch.x * size[0] / self.width)
+        scaled_y = int(touch.y * size[1] / self.height)
+        if touch.button == "left":
+            self.poke_touches.append((scaled_x, scaled_y))
+        if touch.button == "right":
+            self.wall_touches.append((scaled_x, scaled_y))
         return True
 
+    def _send_touches(self):
+        for touches, function in ((self.poke_touches, self.solver.poke),
+                                  (self.wall_touches, self.solver.add_wall)):
+            if touches:
+                x, y = np.array(touches).T
+                self.simulation.call(function, x, y)
+                touches.clear()
+
     def on_touch_down(self, touch):
         self.poke(touch)
         return True
@@ -149,9 +189,14 @@ class Display(Widget):
 
 class Navier_Stokes(App):
     def build(self):
-        display = Display()
-        Clock.schedule_interval(display.update, 1.0/120.0)
-        return display
+        self.display = Display()
+        Clock.schedule_interval(self.display.update, 1.0/120.0)
+        return self.display
+
+    def on_stop(self):
+        self.display.simulation.stop()
+        if self.display.recorder:
+            self.display.recorder.close()
 
 
 if __name__ == '__main__':
@@ -2,6 +2,9 @@
 """
 Kivy implementation of 1D burgers.
 
+Run from the repository root:
+    python -m pre_navier_stokes.one_dimensional.burgers_1d
+
 click to displace line
 'r' to reset
 """
@@ -10,8 +13,8 @@ from kivy.uix.widget import Widget
 from kivy.clock import Clock
 from kivy.graphics import Line
 from kivy.core.window import Window
-import numpy as np
-import scipy.ndimage as nd
+from solvers import Burgers1D
+from solvers.render import Polyline
 
 array_length = 512
 
@@ -22,8 +25,8 @@ class Display(Widget):
             self.line = Line()
         self._keyboard = Window.request_keyboard(self._keyboard_closed, self)
         self._keyboard.bind(on_key_down=self._on_keyboard_down)
-        self.burgers_1d = np.full(array_length, .5, dtype=np.float32)
-        self.burgers_1d[array_length // 4 : 3 * array_length // 4] = .75
+        self.solver = Burgers1D(array_length)
+        self.polyline = Polyline()
 
     def _keyboard_closed(self):
         self._keyboard.unbind(on_key_down=self._on_keyboard_down)
@@ -31,27 +34,20 @@ class Display(Widget):
 
     def _on_keyboard_down(self, keyboard, keycode, text, modifiers):
         if keycode[1] == 'r':  #Reset
-            self.burgers_1d = np.full(array_length, .5, dtype=np.float32)
-            self.burgers_1d[array_length // 4 : 3 * array_length // 4] = .75
+            self.solver.reset()
         return True
 
     def update(self, dt):
-        self.burgers_1d = .75 * self.burgers_1d *\
-                          nd.convolve1d(self.burgers_1d, [.5, -1, .5],
-                                        mode='wrap') +\
-                          nd.convolve1d(self.burgers_1d, [.25, .5, .25],
-                                        mode='wrap')
+        self.solver.step()
 
-        self.line.points = [coor
-                            for x, y in enumerate(self.burgers_1d)
-                            for coor in [x * self.width / array_length,
-                                         self.height * y]]
+        self.line.points = self.polyline.draw(self.solver.u, self.width,
+                                              self.height)
         return True
 
     def poke(self, poke_x, poke_y):
         scaled_x = int(poke_x * array_length / self.width)
         scaled_y = poke_y / self.height
-        self.burgers_1d[scaled_x - 2:scaled_x + 3] = scaled_y
+        self.solver.poke(scaled_x, scaled_y)
         return True
 
     def on_touch_down(self, touch):
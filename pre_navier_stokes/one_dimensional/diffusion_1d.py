@@ -2,16 +2,21 @@
 """
 Kivy implementation of 1D diffusion.
 
+Run from the repository root:
+    python -m pre_navier_stokes.one_dimensional.diffusion_1d
+
 click to displace line
 'r' to reset
+left/right to change kernel
+up/down to change damping
 """
 from kivy.app import App
 from kivy.uix.widget import Widget
 from kivy.clock import Clock
 from kivy.graphics import Line
 from kivy.core.window import Window
-import numpy as np
-import scipy.ndimage as nd
+from solvers import Diffusion1D
+from solvers.render import Polyline
 
 array_length = 512
 
@@ -22,51 +27,38 @@ class Display(Widget):
             self.line = Line()
         self._keyboard = Window.request_keyboard(self._keyboard_closed, self)
         self._keyboard.bind(on_key_down=self._on_keyboard_down)
-        self.kernels_1d = [np.array([1., 0., 0.]),
-                           np.array([.5, 0., .5]),
-                           np.array([1/3, 1/3, 1/3]),
-                           np.array([.25, .5, .25]),
-                           np.array([.1, .2, .4, .2, .1])]
-        self.kernel = 1
-        self.damping = 1.
-        self.diffusion_1d = np.full(array_length, .5, dtype=np.float32)
-        self.diffusion_1d[array_length // 4 : 3 * array_length // 4] = .75
+        self.solver = Diffusion1D(array_length)
+        self.polyline = Polyline()
 
     def _keyboard_closed(self):
         self._keyboard.unbind(on_key_down=self._on_keyboard_down)
         self._keyboard = None
 
     def _on_keyboard_down(self, keyboard, keycode, text, modifiers):
+        solver = self.solver
         if keycode[1] == 'r':  #Reset
-            self.diffusion_1d = np.full(array_length, .5, dtype=np.float32)
-            self.diffusion_1d[array_length // 4 : 3 * array_length // 4] = .75
-            self.damping = 1.
+            solver.reset()
         if keycode[1] == 'left': #Change kernel
-            self.kernel = (self.kernel - 1) % len(self.kernels_1d)
+            solver.kernel = (solver.kernel - 1) % len(solver.kernels)
         if keycode[1] == 'right':
-            self.kernel = (self.kernel + 1) % len(self.kernels_1d)
+            solver.kernel = (solver.kernel + 1) % len(solver.kernels)
         if keycode[1] == 'up':  #Increase damping
-            self.damping -= .001
+            solver.damping -= .001
         if keycode[1] == 'down': #Decrease damping
-            self.damping += .001
-            if self.damping > 1: self.damping = 1.
+            solver.damping += .001
+            if solver.damping > 1: solver.damping = 1.
         return True
 
     def update(self, dt):
-        self.diffusion_1d = self.damping *\
-                            nd.convolve1d(self.diffusion_1d,
-                                          self.kernels_1d[self.kernel],
-                                          mode='wrap')
-        self.line.points = [coor
-                            for x, y in enumerate(self.diffusion_1d)
-                            for coor in [x * self.width / array_length,
-                                         self.height * y]]
+        self.solver.step()
+        self.line.points = self.polyline.draw(self.solver.u, self.width,
+                                              self.height)
         return True
 
     def poke(self, poke_x, poke_y):
         scaled_x = int(poke_x * array_length / self.width)
         scaled_y = poke_y / self.height
-        self.diffusion_1d[scaled_x - 2:scaled_x + 3] = scaled_y
+        self.solver.poke(scaled_x, scaled_y)
         return True
 
     def on_touch_down(self, touch):
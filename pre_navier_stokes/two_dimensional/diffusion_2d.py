@@ -2,6 +2,9 @@
 """
 Kivy implementation of 1D burgers.
 
+Run from the repository root:
+    python -m pre_navier_stokes.two_dimensional.diffusion_2d
+
 click to displace line
 'r' to reset
 """
@@ -11,8 +14,8 @@ from kivy.clock import Clock
 from kivy.graphics.texture import Texture
 from kivy.graphics import Rectangle
 from kivy.core.window import Window
-import numpy as np
-import scipy.ndimage as nd
+from solvers import Diffusion2D
+from solvers.render import Framebuffer
 
 texture_dim = [512, 512]
 
@@ -26,9 +29,8 @@ class Display(Widget):
         self.bind(size=self._update_rect, pos=self._update_rect)
         self._keyboard = Window.request_keyboard(self._keyboard_closed, self)
         self._keyboard.bind(on_key_down=self._on_keyboard_down)
-        self.diffusion_2d = np.zeros(texture_dim, dtype=np.float32).T
-        self.diffusion_2d[texture_dim[0] // 4 : 3 * texture_dim[0] // 4,
-                          texture_dim[1] // 4 : 3 * texture_dim[1] // 5] = 1
+        self.solver = Diffusion2D(texture_dim)
+        self.framebuffer = Framebuffer(self.solver.shape)
 
     def _update_rect(self, *args):
         self.rect.size = self.size
@@ -40,28 +42,21 @@ class Display(Widget):
 
     def _on_keyboard_down(self, keyboard, keycode, text, modifiers):
         if keycode[1] == 'r':  #Reset
-            self.diffusion_2d = np.zeros(texture_dim, dtype=np.float32).T
-            self.diffusion_2d[texture_dim[0] // 4 : 3 * texture_dim[0] // 4,
-                               texture_dim[1] // 4 : 3 * texture_dim[1] // 5] = 1
+            self.solver.reset()
         return True
 
     def update(self, dt):
-        kernel = np.array([[.05, .2, .05], [.2, 0, .2], [.05, .2, .05]])
-        self.diffusion_2d = nd.convolve(self.diffusion_2d, kernel,
-                                         mode='wrap')
-
-        self.texture.blit_buffer(np.dstack([np.zeros(texture_dim,
-                                               dtype=np.float32)] * 2 +\
-                                               [self.diffusion_2d]).tobytes(),
-                                 colorfmt='rgb', bufferfmt='float')
+        self.solver.step()
+
+        pixels = self.framebuffer.draw(self.solver.u)
+        self.texture.blit_buffer(pixels, colorfmt='rgb', bufferfmt='ubyte')
         self.canvas.ask_update()
         return True
 
     def poke(self, poke_x, poke_y):
         scaled_x = int(poke_x * texture_dim[0] / self.width)
         scaled_y = int(poke_y * texture_dim[1] / self.height)
-        self.diffusion_2d[scaled_y - 5:scaled_y + 6,
-                           scaled_x - 5:scaled_x + 6] = 1
+        self.solver.poke(scaled_x, scaled_y)
         return True
 
     def on_touch_down(self, touch):
@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*
+"""
+GUI-free solvers.  The kivy scripts in this repository are thin viewers on top
+of these.
+"""
+from .navier_stokes import NavierStokes
+from .one_dimensional import Diffusion1D, Burgers1D, NonlinearConvection1D
+from .two_dimensional import (Burgers2D, Convection2D, Diffusion2D, Laplace2D,
+                              NonlinearConvection2D, Poisson2D)
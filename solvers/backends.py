@@ -0,0 +1,331 @@
+# -*- coding: utf-8 -*
+"""
+Update engines for the 2D Navier_Stokes solver.
+
+'convolve' is the reference chain of scipy convolutions.  'fused' keeps the
+fields in preallocated arrays padded with a one cell halo and evaluates the
+3x3 stencils as sliced views of those arrays, writing every intermediate into
+preallocated buffers.  A step is three sweeps (momentum, external flow,
+pressure) instead of six convolutions and a dozen temporaries.
+
+Walls are enforced through the solver's sparse `wall_index` (see walls.py),
+so they cost O(wall cells) per step in every engine.
+
+The stage functions work on any `window` (row_start, row_stop, col_start,
+col_stop) of the interior, so they can be reused on tiles.
+
+Every engine also steps ensembles: fields with a leading batch axis and
+parameters shaped (batch, 1, 1) that broadcast against them.
+
+'numba' (see numba_backend.py) compiles the same three sweeps and runs them in
+parallel over rows.  It falls back to 'fused' if numba isn't installed.
+'decomposed' (see decomposed.py) splits the grid into tiles stepped by worker
+processes.  'tiled' (see tiled.py) only steps the tiles where something is
+happening.  'out_of_core' (see out_of_core.py) keeps the fields in
+memory-mapped files and streams them through the stages in bands of rows.
+"""
+import warnings
+
+import numpy as np
+from . import separable
+
+#convective kernel
+con_kernel = np.array([[   0, .25,    0],
+                       [ .25,  -1,  .25],
+                       [   0, .25,    0]])
+#diffusion kernel
+dif_kernel = np.array([[.025,  .1, .025],
+                       [  .1,  .5,   .1],
+                       [.025,  .1, .025]])
+#poisson kernel
+poi_kernel = np.array([[   0, .25,    0],
+                       [ .25,   0,  .25],
+                       [   0, .25,    0]])
+#convolving with this and scaling by external_flow gives the flow's change
+shift_kernel = np.array([[ 0, 0, 0],
+                         [-1, 0, 1],
+                         [ 0, 0, 0]])
+
+
+def interior(padded):
+    return padded[..., 1:-1, 1:-1]
+
+def fill_halo(padded, bc):
+    """
+    Fill the one cell halo of `padded` in place the same way scipy's `mode=bc`
+    would extend the interior.
+    """
+    if bc == 'wrap':
+        padded[..., 0, 1:-1] = padded[..., -2, 1:-1]
+        padded[..., -1, 1:-1] = padded[..., 1, 1:-1]
+        padded[..., :, 0] = padded[..., :, -2]
+        padded[..., :, -1] = padded[..., :, 1]
+    elif bc in ('reflect', 'nearest'):  #These agree for a one cell halo.
+        padded[..., 0, 1:-1] = padded[..., 1, 1:-1]
+        padded[..., -1, 1:-1] = padded[..., -2, 1:-1]
+        padded[..., :, 0] = padded[..., :, 1]
+        padded[..., :, -1] = padded[..., :, -2]
+    elif bc == 'mirror':
+        padded[..., 0, 1:-1] = padded[..., 2, 1:-1]
+        padded[..., -1, 1:-1] = padded[..., -3, 1:-1]
+        padded[..., :, 0] = padded[..., :, 2]
+        padded[..., :, -1] = padded[..., :, -3]
+    elif bc == 'constant':
+        padded[..., 0, :] = 0
+        padded[..., -1, :] = 0
+        padded[..., :, 0] = 0
+        padded[..., :, -1] = 0
+    else:
+        raise ValueError("unknown boundary condition {!r}".format(bc))
+
+def full_window(padded):
+    return 0, padded.shape[-2] - 2, 0, padded.shape[-1] - 2
+
+def shifted(padded, window):
+    """
+    Return a function giving the view of `padded` offset by (dr, dc) from
+    `window` -- i.e. the neighbors used by a 3x3 stencil.
+    """
+    r0, r1, c0, c1 = window
+    def at(dr, dc):
+        return padded[..., 1 + r0 + dr:1 + r1 + dr, 1 + c0 + dc:1 + c1 + dc]
+    return at
+
+def _cross(at, out):
+    np.add(at(-1, 0), at(1, 0), out=out)
+    out += at(0, -1)
+    out += at(0, 1)
+    return out
+
+def _diagonals(at, out):
+    np.add(at(-1, -1), at(-1, 1), out=out)
+    out += at(1, -1)
+    out += at(1, 1)
+    return out
+
+def momentum_stage(m, p, out, tmp, window, viscosity, rho, damping):
+    """
+    out = (dif(m) - viscosity * m * con(m) + rho * con(p)) * damping
+    """
+    r0, r1, c0, c1 = window
+    M, P = shifted(m, window), shifted(p, window)
+    o = shifted(out, window)(0, 0)
+    t0, t1 = (t[..., r0:r1, c0:c1] for t in tmp)
+    center = M(0, 0)
+
+    #diffusion, with the weights as python floats: numpy float64 scalars
+    #would run these float32 ops through float64 loops.
+    _cross(M, t0)
+    np.multiply(t0, float(dif_kernel[0, 1]), out=o)
+    _diagonals(M, t1)
+    t1 *= float(dif_kernel[0, 0])
+    o += t1
+    np.multiply(center, float(dif_kernel[1, 1]), out=t1)
+    o += t1
+
+    #convection
+    t0 *= .25
+    t0 -= center
+    t0 *= center
+    t0 *= viscosity
+    o -= t0
+
+    #pressure
+    _cross(P, t0)
+    t0 *= .25
+    t0 -= P(0, 0)
+    t0 *= rho
+    o += t0
+
+    o *= damping
+
+def flow_stage(m, out, window, external_flow):
+    """
+    out = m shifted by the external flow; the same as convolving with the flow
+    kernel [-external_flow, 1, external_flow].
+    """
+    M = shifted(m, window)
+    o = shifted(out, window)(0, 0)
+    np.subtract(M(0, -1), M(0, 1), out=o)
+    o *= external_flow
+    o += M(0, 0)
+
+def pressure_stage(m, p, out, tmp, window, rho, damping):
+    """
+    out = (poi(p) + rho / 2 * (dif - dif**2)) * damping, where dif = poi(m)
+    """
+    r0, r1, c0, c1 = window
+    o = shifted(out, window)(0, 0)
+    t0, t1 = (t[..., r0:r1, c0:c1] for t in tmp)
+
+    source_stage(m, t0, t1, window, rho)
+    _cross(shifted(p, window), o)
+    o *= .25
+    o += t0
+    o *= damping
+
+def source_stage(m, out, tmp, window, rho):
+    """
+    out = rho / 2 * (dif - dif**2), where dif = poi(m).  `out` and `tmp` are
+    already windowed.
+    """
+    _cross(shifted(m, window), out)
+    out *= .25
+    np.multiply(out, out, out=tmp)
+    out -= tmp
+    out *= rho / 2
+
+
+class ConvolveBackend:
+    """
+    Reference implementation -- a chain of scipy convolutions.  Ensembles are
+    convolved in one call with kernels that don't reach across members.
+    Every kernel here is separable, so the convolutions go through
+    separable.convolve's 1D passes.
+    """
+    def __init__(self, solver):
+        pass
+
+    def step(self, solver):
+        bc = solver.bc
+        rho = solver.rho
+        damping = solver.damping
+        external_flow = solver.external_flow
+
+        def convolve(field, kernel):
+            return separable.convolve(field, kernel, mode=bc)
+
+        with solver.stage('momentum'):
+            momentum = (  convolve(solver.momentum, dif_kernel)
+                        - (  solver.viscosity * solver.momentum
+                           * convolve(solver.momentum, con_kernel))
+                        + convolve(solver.pressure, con_kernel) * rho)
+            momentum *= damping
+
+        with solver.stage('flow'):
+            if np.ndim(external_flow):
+                #Each member has its own flow.
+                momentum += external_flow * convolve(momentum, shift_kernel)
+            elif external_flow:
+                momentum = convolve(momentum, solver.flow_kernel)
+
+        with solver.stage('pressure'):
+            #dif for difference, not diffusion -- dif is the change in momentum
+            dif = convolve(momentum, poi_kernel)
+
+            if solver._pressure_solver is None:
+                pressure = ((convolve(solver.pressure, poi_kernel) +
+                           rho / 2 * (dif - dif**2)) * damping)
+            else:
+                pressure = solver._pressure_solver.solve(
+                    rho / 2 * (dif - dif**2), np.empty_like(dif))
+
+        #Wall boundary conditions
+        with solver.stage('walls'):
+            walls = solver.wall_index
+            walls.fill(momentum, -external_flow)
+            walls.fill(pressure, 0)
+        solver.momentum, solver.pressure = momentum, pressure
+
+
+class FusedBackend:
+    """
+    Sliced-stencil implementation over preallocated, halo-padded buffers.
+
+    From the first step on, the solver's `momentum` and `pressure` are views
+    into the padded buffers, so pokes write straight into them.  If the
+    solver's arrays are replaced (e.g. by `reset`) they're copied in at the
+    start of the next step.
+    """
+    def __init__(self, solver):
+        height, width = solver.shape
+        padded_shape = solver.field_shape[:-2] + (height + 2, width + 2)
+        dtype = solver.dtype
+        self.m, self.p, self.a, self.q = (np.zeros(padded_shape, dtype=dtype)
+                                          for _ in range(4))
+        self.tmp = [np.empty(padded_shape[:-2] + (height, width), dtype=dtype)
+                    for _ in range(2)]
+        self.momentum = self.pressure = None  #bound at the first step
+
+    def _bind(self, solver):
+        interior(self.m)[:] = solver.momentum
+        interior(self.p)[:] = solver.pressure
+        self._publish(solver)
+
+    def _publish(self, solver):
+        solver.momentum = self.momentum = interior(self.m)
+        solver.pressure = self.pressure = interior(self.p)
+
+    def step(self, solver):
+        if solver.momentum is not self.momentum or\
+           solver.pressure is not self.pressure:
+            self._bind(solver)
+
+        bc = solver.bc
+        rho = solver.rho
+        damping = solver.damping
+        external_flow = solver.external_flow
+        window = full_window(self.m)
+
+        with solver.stage('momentum'):
+            fill_halo(self.m, bc)
+            fill_halo(self.p, bc)
+            momentum_stage(self.m, self.p, self.a, self.tmp, window,
+                           solver.viscosity, rho, damping)
+
+        with solver.stage('flow'):
+            if np.any(external_flow):
+                fill_halo(self.a, bc)
+                flow_stage(self.a, self.m, window, external_flow)
+            else:
+                self.m, self.a = self.a, self.m
+
+        with solver.stage('pressure'):
+            fill_halo(self.m, bc)
+            if solver._pressure_solver is None:
+                pressure_stage(self.m, self.p, self.q, self.tmp, window, rho,
+                               damping)
+            else:
+                source, tmp = self.tmp
+                source_stage(self.m, source, tmp, window, rho)
+                solver._pressure_solver.solve(source, interior(self.q))
+            self.p, self.q = self.q, self.p
+
+        #Wall boundary conditions
+        with solver.stage('walls'):
+            walls = solver.wall_index
+            walls.fill(interior(self.m), -external_flow)
+            walls.fill(interior(self.p), 0)
+
+        self._publish(solver)
+
+
+def numba_backend(solver):
+    from . import numba_backend
+    if numba_backend.numba is None:
+        warnings.warn("numba is not installed; using the 'fused' backend")
+        return FusedBackend(solver)
+    return numba_backend.NumbaBackend(solver)
+
+
+def decomposed_backend(solver):
+    from .decomposed import DecomposedBackend
+    return DecomposedBackend(solver)
+
+
+def tiled_backend(solver):
+    from .tiled import TiledBackend
+    return TiledBackend(solver)
+
+
+def out_of_core_backend(solver):
+    from .out_of_core import OutOfCoreBackend
+    return OutOfCoreBackend(solver)
+
+
+BACKENDS = {'convolve': ConvolveBackend,
+            'fused': FusedBackend,
+            'numba': numba_backend,
+            'decomposed': decomposed_backend,
+            'tiled': tiled_backend,
+            'out_of_core': out_of_core_backend}
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*
+"""
+Checkpoint/restart for the 2D Navier_Stokes solver.
+
+A checkpoint is a directory holding momentum.npy, pressure.npy and walls.npy
+plus meta.json with the step count and the solver's parameters.  Fields are
+streamed straight from the solver's arrays into the .npy files, and `load`
+memory-maps them copy-on-write, so a restart only reads the pages a step
+actually touches and never writes back to the checkpoint.
+
+    solver.hooks.append(Checkpointer('run.ckpt', every=1000))
+    ...
+    solver = load('run.ckpt')
+"""
+import json
+import os
+import shutil
+
+import numpy as np
+from .navier_stokes import NavierStokes
+
+FIELDS = 'momentum', 'pressure', 'walls'
+PARAMETERS = 'viscosity', 'rho', 'damping', 'external_flow'
+
+
+def _value(value):
+    """A parameter as JSON: a float, or a list of per-member floats."""
+    if np.ndim(value):
+        return np.ravel(value).tolist()
+    return float(value)
+
+def save(solver, path):
+    """
+    Write `solver`'s state to the checkpoint directory `path`.  It's written
+    beside `path` first and swapped in when complete, so an interrupted save
+    leaves the previous checkpoint intact.
+    """
+    meta = {'steps': solver.steps,
+            'size': list(solver.size),
+            'batch': solver.batch,
+            'bc': solver.bc,
+            'pressure_solver': solver.pressure_solver,
+            'pressure_tolerance': solver.pressure_tolerance,
+            'dtype': solver.dtype.name,
+            'storage': solver.storage.name}
+    meta.update((name, _value(getattr(solver, name))) for name in PARAMETERS)
+    if isinstance(solver.backend, str):
+        meta['backend'] = solver.backend
+
+    path = os.fspath(path)
+    partial, previous = path + '.partial', path + '.previous'
+    shutil.rmtree(partial, ignore_errors=True)
+    os.makedirs(partial)
+    for name in FIELDS:
+        np.save(os.path.join(partial, name + '.npy'), getattr(solver, name))
+    with open(os.path.join(partial, 'meta.json'), 'w') as file:
+        json.dump(meta, file, indent=4)
+
+    shutil.rmtree(previous, ignore_errors=True)
+    if os.path.exists(path):
+        os.rename(path, previous)
+    os.rename(partial, path)
+    shutil.rmtree(previous, ignore_errors=True)
+
+def load(path, mmap_mode='c', **kwargs):
+    """
+    A NavierStokes solver restored from the checkpoint directory `path`.
+    Keyword arguments override the saved parameters, e.g. `backend`.  The
+    fields are memory-mapped with `mmap_mode` ('c' for copy-on-write; None
+    reads them into memory).
+    """
+    path = os.fspath(path)
+    with open(os.path.join(path, 'meta.json')) as file:
+        meta = json.load(file)
+    steps = meta.pop('steps')
+    meta.update(kwargs)
+
+    solver = NavierStokes(**meta)
+    for name in FIELDS:
+        field = np.load(os.path.join(path, name + '.npy'), mmap_mode=mmap_mode)
+        if field.shape != solver.field_shape:
+            raise ValueError("{} has shape {}, expected {}".format(
+                name, field.shape, solver.field_shape))
+        setattr(solver, name, field)
+    solver.steps = steps
+    return solver
+
+
+class Checkpointer:
+    """
+    A solver hook that saves a checkpoint to `path` every `every` steps:
+        solver.hooks.append(Checkpointer(path, every))
+    """
+    def __init__(self, path, every=1000):
+        self.path = path
+        self.every = every
+
+    def __call__(self, solver):
+        if solver.steps % self.every == 0:
+            save(solver, self.path)
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*
+"""
+Domain-decomposed backend: the grid is split into tiles, each stepped by its
+own worker process.
+
+momentum and pressure, both double buffered, live in one shared memory
+block.  Every step each worker gathers its tile plus a three cell halo,
+wrapping around the edges, from the current buffers -- the halo exchange.  It
+then runs the three fused stages on that local block, each stage consuming one
+cell of halo, and writes its tile into the other buffers.  So there is one
+exchange and one round of synchronization per step, whatever the number of
+workers: the parent releases each worker's `go` semaphore and acquires the
+shared `finished` one once per worker.  Walls are enforced by the parent
+afterwards, through the solver's sparse `wall_index`.
+
+While it waits the parent checks that every worker is still alive, so a
+worker that raises or is killed (e.g. for memory) makes `step` raise instead
+of hang, and the backend shuts down.  Semaphores are used rather than
+barriers as a barrier can't be woken once a process waiting on it has died.
+
+Only bc='wrap' and the 'relax' pressure update are supported.  Use it as
+    NavierStokes(size, backend='decomposed')
+or, to pick the number of workers,
+    NavierStokes(size, backend=partial(DecomposedBackend, workers=8))
+"""
+import os
+import time
+import weakref
+import multiprocessing as mp
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from .backends import flow_stage, momentum_stage, pressure_stage
+
+HALO = 3  #one cell per stage
+CONTROL = 5  #run flag, viscosity, rho, damping, external_flow
+
+
+def tile_grid(workers):
+    """(rows, cols) of tiles for `workers` workers, as square as possible."""
+    cols = int(workers ** .5)
+    while workers % cols:
+        cols -= 1
+    return workers // cols, cols
+
+def tiles(shape, workers):
+    """(row_start, row_stop, col_start, col_stop) of each worker's tile."""
+    rows, cols = tile_grid(workers)
+    row_edges = np.linspace(0, shape[0], rows + 1).astype(int)
+    col_edges = np.linspace(0, shape[1], cols + 1).astype(int)
+    return [(row_edges[i], row_edges[i + 1], col_edges[j], col_edges[j + 1])
+            for i in range(rows) for j in range(cols)]
+
+
+class SharedFields:
+    """Views of the double-buffered fields and the control block."""
+    def __init__(self, shape, dtype, name=None):
+        fields_size = 4 * shape[0] * shape[1] * np.dtype(dtype).itemsize
+        size = fields_size + CONTROL * 8
+        self.shm = SharedMemory(name=name, create=name is None, size=size)
+        fields = np.ndarray((4,) + shape, dtype=dtype, buffer=self.shm.buf)
+        self.momentum = fields[0:2]
+        self.pressure = fields[2:4]
+        self.control = np.ndarray(CONTROL, dtype=np.float64,
+                                  buffer=self.shm.buf, offset=fields_size)
+
+    def close(self):
+        del self.momentum, self.pressure, self.control
+        self.shm.close()
+
+
+def _worker(name, shape, dtype, tile, go, finished):
+    shared = SharedFields(shape, dtype, name)
+    r0, r1, c0, c1 = tile
+    height, width = r1 - r0, c1 - c0
+    rows = np.arange(r0 - HALO, r1 + HALO) % shape[0]
+    cols = np.arange(c0 - HALO, c1 + HALO) % shape[1]
+    local_shape = height + 2 * HALO, width + 2 * HALO
+
+    m, p, a, q = (np.zeros(local_shape, dtype=dtype) for _ in range(4))
+    tmp = [np.empty((height + 4, width + 4), dtype=dtype) for _ in range(2)]
+    row_buffer = np.empty((local_shape[0], shape[1]), dtype=dtype)
+
+    def gather(field, out):
+        np.take(field, rows, axis=0, out=row_buffer)
+        np.take(row_buffer, cols, axis=1, out=out)
+
+    parity = 0
+    while True:
+        go.acquire()
+        if shared.control[0] < 0:
+            break
+        #As dtype scalars, so they don't promote the fields to float64.
+        viscosity, rho, damping, external_flow = (
+            shared.control[1:].astype(dtype))
+        gather(shared.momentum[parity], m)
+        gather(shared.pressure[parity], p)
+
+        #Each stage's window is one cell smaller than the last.
+        momentum_stage(m, p, a, tmp, (0, height + 4, 0, width + 4),
+                       viscosity, rho, damping)
+        if external_flow:
+            flow_stage(a, m, (1, height + 3, 1, width + 3), external_flow)
+            new = m
+        else:
+            new = a
+        pressure_stage(new, p, q, tmp, (2, height + 2, 2, width + 2),
+                       rho, damping)
+
+        shared.momentum[1 - parity, r0:r1, c0:c1] = new[HALO:-HALO, HALO:-HALO]
+        shared.pressure[1 - parity, r0:r1, c0:c1] = q[HALO:-HALO, HALO:-HALO]
+
+        parity = 1 - parity
+        finished.release()
+    shared.close()
+
+def _shutdown(shared, processes, go):
+    shared.control[0] = -1
+    for semaphore in go:
+        semaphore.release()
+    for process in processes:
+        process.join(timeout=5)
+        if process.is_alive():
+            process.terminate()
+    shared.close()
+    shared.shm.unlink()
+
+
+class DecomposedBackend:
+    """
+    Steps the solver's fields with `workers` processes (default: one per
+    core), one tile each.  The solver's momentum and pressure become views
+    into shared memory; arrays replaced by e.g. `reset` are copied in at the
+    next step.  Workers are shut down when the backend is collected; call
+    `NavierStokes.close` to do it sooner and get the fields back as ordinary
+    arrays (views into the shared block are invalid afterwards).  A step
+    that takes the workers longer than `timeout` seconds counts as failed.
+    """
+    def __init__(self, solver, workers=None, timeout=60.):
+        if solver.bc != 'wrap':
+            raise ValueError("the decomposed backend needs bc='wrap', "
+                             "not {!r}".format(solver.bc))
+        if solver._pressure_solver is not None or solver.batch is not None:
+            raise ValueError("the decomposed backend only supports single "
+                             "simulations with the 'relax' pressure update")
+
+        workers = workers or os.cpu_count()
+        self.timeout = timeout
+        shape = solver.shape
+        self.shared = SharedFields(shape, solver.dtype)
+        self.parity = 0
+        self.go = [mp.Semaphore(0) for _ in range(workers)]
+        self.finished = mp.Semaphore(0)
+        self.processes = [mp.Process(target=_worker, daemon=True,
+                                     args=(self.shared.shm.name, shape,
+                                           solver.dtype, tile, go,
+                                           self.finished))
+                          for tile, go in zip(tiles(shape, workers), self.go)]
+        for process in self.processes:
+            process.start()
+        self._finalizer = weakref.finalize(self, _shutdown, self.shared,
+                                           self.processes, self.go)
+        self.momentum = self.pressure = None  #bound at the first step
+
+    def _bind(self, solver):
+        shared = self.shared
+        shared.momentum[self.parity] = solver.momentum
+        shared.pressure[self.parity] = solver.pressure
+        self._publish(solver)
+
+    def _publish(self, solver):
+        shared = self.shared
+        solver.momentum = self.momentum = shared.momentum[self.parity]
+        solver.pressure = self.pressure = shared.pressure[self.parity]
+
+    def step(self, solver):
+        if (solver.momentum is not self.momentum or
+            solver.pressure is not self.pressure):
+            self._bind(solver)
+
+        with solver.stage('workers'):
+            self.shared.control[:] = (1, solver.viscosity, solver.rho,
+                                      solver.damping, solver.external_flow)
+            for go in self.go:
+                go.release()
+            if not self._wait():
+                self._failed(solver)
+            self.parity = 1 - self.parity
+            self._publish(solver)
+
+        #Wall boundary conditions, through the solver's sparse index
+        with solver.stage('walls'):
+            walls = solver.wall_index
+            walls.fill(self.momentum, -solver.external_flow)
+            walls.fill(self.pressure, 0)
+
+    def _wait(self, poll=.1):
+        """Wait for every worker to finish the step; False if one can't."""
+        deadline = time.monotonic() + self.timeout
+        for _ in self.processes:
+            while not self.finished.acquire(timeout=poll):
+                if time.monotonic() > deadline or\
+                   not all(process.is_alive() for process in self.processes):
+                    return False
+        return True
+
+    def _failed(self, solver):
+        #Shut down, leaving the solver the fields from before this step.  The
+        #workers still running exit cleanly, so any failure codes are the
+        #culprits'.
+        solver.close()
+        codes = [process.exitcode for process in self.processes
+                 if process.exitcode]
+        if codes:
+            raise RuntimeError("decomposed backend workers failed with exit "
+                               "codes {}".format(codes))
+        raise RuntimeError("decomposed backend workers didn't finish a step "
+                           "within {} seconds".format(self.timeout))
+
+    def close(self):
+        self._finalizer()
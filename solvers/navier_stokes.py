@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*
+"""
+Headless 2D Navier_Stokes solver.
+
+Nothing in here imports kivy, so the solver can be stepped as fast as the
+hardware allows on machines without a display.  navier_stokes_2D.py is just a
+viewer on top of it.
+
+Note that boundary conditions(bcs) and external flow are 'hacked'.  To properly
+account for bcs one should 'roll' the arrays by hand instead of using scipy's
+convolve.  It's doubtful the accuracy is worth the overall slowdown of the
+updates though.
+"""
+from contextlib import nullcontext
+
+import numpy as np
+from .backends import BACKENDS
+from .pressure import PRESSURE_SOLVERS
+from .walls import WallIndex
+
+COMPUTE_DTYPES = np.dtype(np.float32), np.dtype(np.float64)
+
+#drop just makes pokes look a little better
+drop = np.array([[0., 0., 1., 1., 1., 1., 1., 0., 0.],
+                 [0., 1., 1., 1., 1., 1., 1., 1., 0.],
+                 [1., 1., 1., 1., 1., 1., 1., 1., 1.],
+                 [1., 1., 1., 1., 1., 1., 1., 1., 1.],
+                 [1., 1., 1., 1., 1., 1., 1., 1., 1.],
+                 [1., 1., 1., 1., 1., 1., 1., 1., 1.],
+                 [1., 1., 1., 1., 1., 1., 1., 1., 1.],
+                 [0., 1., 1., 1., 1., 1., 1., 1., 0.],
+                 [0., 0., 1., 1., 1., 1., 1., 0., 0.],])
+_drop_rows, _drop_cols = np.nonzero(drop == 1)
+_drop_rows -= 4  #offsets from the center cell
+_drop_cols -= 4
+
+class NavierStokes:
+    """
+    State (momentum, pressure, walls) and parameters of a 2D Navier_Stokes
+    simulation.  `size` is (width, height) like a texture size; the fields
+    have shape (height, width).  `backend` names the update engine, one of
+    `BACKENDS`, or is a callable that builds one from the solver.
+    `pressure_solver`, one of `PRESSURE_SOLVERS`, picks how pressure is
+    updated; the iterative ones stop once the residual is below
+    `pressure_tolerance` relative to the source.
+
+    With `batch=B` the solver steps an ensemble of B independent simulations
+    at once: the fields have shape (B, height, width) and viscosity, rho,
+    damping and external_flow may each be a scalar shared by all members or a
+    sequence of B values, stored as a (B, 1, 1) array so it broadcasts
+    against the fields.
+
+    `dtype` is what steps are computed in: float32, the fast path, or
+    float64, the reference.  `storage` is what the fields are kept in between
+    steps, `dtype` by default; e.g. float16 halves the memory of a large
+    ensemble, at the cost of converting the fields to and from `dtype` every
+    step.
+
+    Walls are painted with `add_wall`, which keeps `wall_index`, the sparse
+    index the backends enforce walls through, up to date.  Replacing `walls`
+    outright also works; the index is rebuilt from it on next use.
+    """
+    fields = 'pressure', 'momentum'  #what e.g. record.Recorder records
+
+    def __init__(self, size=(256, 256), bc="wrap", viscosity=.018, rho=1.06,
+                 damping=.994, external_flow=.4, backend="convolve",
+                 pressure_solver="relax", pressure_tolerance=1e-4, batch=None,
+                 dtype=np.float32, storage=None):
+        self.size = list(size)
+        self.batch = batch
+        self.dtype = np.dtype(dtype)
+        if self.dtype not in COMPUTE_DTYPES:
+            raise ValueError("dtype must be float32 or float64, "
+                             "not {}".format(self.dtype))
+        self.storage = np.dtype(storage or dtype)
+        #boundary condition - 'wrap', 'reflect', 'constant', 'nearest',
+        #'mirror'
+        self.bc = bc
+        #Is it odd that negative viscosity still works?
+        self.viscosity = self._members(viscosity)
+        #Density
+        self.rho = self._members(rho)
+        #Breaks conservation, but behavior is more river-like
+        self.damping = self._members(damping)
+        #flow in the horizontal direction -- this is a hack
+        self.external_flow = self._members(external_flow)
+        self.hooks = []  #called after every step, e.g. checkpoint.Checkpointer
+        self.profiler = None  #set to a profiling.Profiler to time each stage
+        self.pressure_solver = pressure_solver
+        self.pressure_tolerance = pressure_tolerance
+        solver = PRESSURE_SOLVERS[pressure_solver]
+        self._pressure_solver = solver and solver(self)
+        self.backend = backend
+        if isinstance(backend, str):
+            backend = BACKENDS[backend]
+        self._backend = backend(self)
+        self.reset()
+
+    @property
+    def shape(self):
+        return self.size[1], self.size[0]
+
+    @property
+    def field_shape(self):
+        if self.batch is None:
+            return self.shape
+        return (self.batch,) + self.shape
+
+    def _members(self, value):
+        """
+        Per-member parameter values as a (batch, 1, 1) array of `dtype`.
+        Scalars become python floats, which numpy won't promote fields to
+        float64 for, as it would for a numpy float64.
+        """
+        if np.ndim(value) == 0:
+            return float(value)
+        if self.batch is None:
+            return value
+        value = np.asarray(value, dtype=self.dtype)
+        if value.size != self.batch:
+            raise ValueError("expected {} values, got {}".format(self.batch,
+                                                                 value.size))
+        return value.reshape(-1, 1, 1)
+
+    @property
+    def flow_kernel(self):
+        return np.array([[0, 0, 0],
+                         [-self.external_flow, 1, self.external_flow],
+                         [0, 0, 0]])
+
+    @property
+    def start_block(self):
+        """(rows, columns) slices of the block `reset` starts moving."""
+        size = self.size
+        return (slice(3 * size[0] // 8, 5 * size[0] // 8),
+                slice(3 * size[1] // 8, 5 * size[1] // 8))
+
+    def reset(self):
+        """
+        Still fluid but for a block in the middle, and no walls.  A backend
+        with a `reset` method of its own, e.g. one that keeps the fields out
+        of memory, sets the fields up instead.
+        """
+        reset = getattr(self._backend, 'reset', None)
+        if reset is not None:
+            reset(self)
+        else:
+            block = (Ellipsis,) + self.start_block
+            self.momentum = np.zeros(self.field_shape, dtype=self.storage)
+            self.momentum[block] = .04
+            self.pressure = np.zeros(self.field_shape, dtype=self.storage)
+            self.pressure[block] = 1
+            self.walls = np.zeros(self.field_shape, dtype=self.storage)
+        #The walls are all clear, nothing to scan.
+        self._wall_index = WallIndex(self.walls, np.empty(0, dtype=np.intp))
+        self.steps = 0
+
+    @property
+    def wall_index(self):
+        """WallIndex of `walls`."""
+        if self._wall_index.walls is not self.walls:
+            self._wall_index = WallIndex(self.walls)
+        return self._wall_index
+
+    def step(self, n=1):
+        """
+        Advance the simulation `n` steps back-to-back, calling each of
+        `hooks` with the solver after every step.
+        """
+        for _ in range(n):
+            self._step()
+            self.steps += 1
+            if self.hooks:
+                with self.stage('hooks'):
+                    for hook in self.hooks:
+                        hook(self)
+        return self
+
+    def _step(self):
+        if self.storage == self.dtype:
+            self._backend.step(self)
+            return
+        self.momentum = self.momentum.astype(self.dtype)
+        self.pressure = self.pressure.astype(self.dtype)
+        self._backend.step(self)
+        self.momentum = self.momentum.astype(self.storage)
+        self.pressure = self.pressure.astype(self.storage)
+
+    def stage(self, name):
+        """A context timing part of a step as `name`, if profiling."""
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.stage(name)
+
+    def close(self):
+        """Release whatever the backend holds, e.g. worker processes."""
+        close = getattr(self._backend, 'close', None)
+        if close is not None:
+            #The backend may own the memory the fields live in.
+            self.momentum = self.momentum.copy()
+            self.pressure = self.pressure.copy()
+            self.walls = self.walls.copy()
+            close()
+
+    def _fields(self, member, *fields):
+        if member is None:
+            return fields
+        return tuple(field[member] for field in fields)
+
+    def _stamp(self, x, y):
+        """
+        Index arrays (rows, cols) of the `drop` around every cell (x, y), where
+        x and y are ints or equal-length arrays of them.  Stamps wrap around
+        with bc 'wrap' and are clipped to the grid otherwise.
+        """
+        height, width = self.shape
+        y = np.asarray(y, dtype=np.intp).ravel()
+        x = np.asarray(x, dtype=np.intp).ravel()
+        rows = np.add.outer(y, _drop_rows).ravel()
+        cols = np.add.outer(x, _drop_cols).ravel()
+        if self.bc == 'wrap':
+            return rows % height, cols % width
+        inside = (rows >= 0) & (rows < height) & (cols >= 0) & (cols < width)
+        return rows[inside], cols[inside]
+
+    def poke(self, x, y, member=None):
+        """
+        Displace fluid around cell (x, y) -- or around every cell, for arrays
+        x and y, in one scatter -- of every ensemble member unless `member` is
+        given.
+        """
+        pressure, momentum = self._fields(member, self.pressure, self.momentum)
+        rows, cols = self._stamp(x, y)
+        pressure[..., rows, cols] = 1.
+        momentum[..., rows, cols] = 0.
+
+    def add_wall(self, x, y, member=None):
+        """
+        Paint a wall around cell (x, y) -- or around every cell, for arrays x
+        and y -- of every ensemble member unless `member` is given.
+        """
+        walls, = self._fields(member, self.walls)
+        rows, cols = index = self._stamp(x, y)
+        walls[..., rows, cols] = 1
+
+        if self.batch is not None:
+            members = np.arange(self.batch)
+            if member is not None:
+                members = np.atleast_1d(members[member])
+            index = (np.repeat(members, len(rows)),
+                     np.tile(index[0], len(members)),
+                     np.tile(index[1], len(members)))
+        self.wall_index.add(index)
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*
+"""
+Numba backend -- the Navier_Stokes (and 1D burgers) stencils compiled to
+machine code, parallelized over rows with prange so a step uses every core.
+Set NUMBA_NUM_THREADS to limit the number of threads.
+
+The sweep runner and the decomposed backend fork worker processes, which can
+leave a process that has started TBB threads hanging at exit, so `configure`
+prefers numba's OpenMP or workqueue threading layers over TBB unless
+NUMBA_THREADING_LAYER or NUMBA_THREADING_LAYER_PRIORITY say otherwise.  It's
+called when a numba solver is built, not on import, and this module is only
+imported then too, so `import solvers` leaves numba alone.
+
+Boundary conditions are handled with per-axis neighbor index maps instead of
+halos: `up[i]` is the row above row `i` after applying `bc`, or -1 if that
+neighbor is the constant 0 (bc='constant').
+
+numba is optional; if it isn't installed `numba` is None and the solvers fall
+back to their numpy paths.
+"""
+import os
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+def configure():
+    """Pick numba's threading layer priority; call before running a kernel."""
+    chosen = {'NUMBA_THREADING_LAYER',
+              'NUMBA_THREADING_LAYER_PRIORITY'} & set(os.environ)
+    if numba is not None and not chosen:
+        numba.config.THREADING_LAYER_PRIORITY = ['omp', 'workqueue', 'tbb']
+
+def neighbors(n, bc):
+    """Index maps (previous, next) along an axis of length `n`."""
+    index = np.arange(n)
+    if bc == 'wrap':
+        return (index - 1) % n, (index + 1) % n
+    previous, next_ = index - 1, index + 1
+    if bc in ('reflect', 'nearest'):
+        previous[0], next_[-1] = 0, n - 1
+    elif bc == 'mirror':
+        previous[0], next_[-1] = 1, n - 2
+    elif bc == 'constant':
+        previous[0], next_[-1] = -1, -1
+    else:
+        raise ValueError("unknown boundary condition {!r}".format(bc))
+    return previous, next_
+
+
+if numba is not None:
+    @numba.njit(inline='always')
+    def _at(a, i, j):
+        if i < 0 or j < 0:
+            return 0.
+        return a[i, j]
+
+    @numba.njit(parallel=True, cache=True)
+    def momentum_kernel(m, p, out, up, down, left, right,
+                        viscosity, rho, damping):
+        height, width = m.shape
+        for i in numba.prange(height):
+            u, d = up[i], down[i]
+            for j in range(width):
+                l, r = left[j], right[j]
+                center = m[i, j]
+                cross = (_at(m, u, j) + _at(m, d, j) +
+                         _at(m, i, l) + _at(m, i, r))
+                diagonals = (_at(m, u, l) + _at(m, u, r) +
+                             _at(m, d, l) + _at(m, d, r))
+                pressure = (.25 * (_at(p, u, j) + _at(p, d, j) +
+                                   _at(p, i, l) + _at(p, i, r)) - p[i, j])
+                out[i, j] = (.5 * center + .1 * cross + .025 * diagonals
+                             - viscosity * center * (.25 * cross - center)
+                             + rho * pressure) * damping
+
+    @numba.njit(parallel=True, cache=True)
+    def flow_kernel(m, out, left, right, external_flow):
+        height, width = m.shape
+        for i in numba.prange(height):
+            for j in range(width):
+                out[i, j] = m[i, j] + external_flow * (_at(m, i, left[j]) -
+                                                       _at(m, i, right[j]))
+
+    @numba.njit(parallel=True, cache=True)
+    def pressure_kernel(m, p, out, up, down, left, right, rho, damping):
+        height, width = m.shape
+        for i in numba.prange(height):
+            u, d = up[i], down[i]
+            for j in range(width):
+                l, r = left[j], right[j]
+                dif = .25 * (_at(m, u, j) + _at(m, d, j) +
+                             _at(m, i, l) + _at(m, i, r))
+                out[i, j] = (.25 * (_at(p, u, j) + _at(p, d, j) +
+                                    _at(p, i, l) + _at(p, i, r))
+                             + rho / 2 * (dif - dif * dif)) * damping
+
+    @numba.njit(parallel=True, cache=True)
+    def source_kernel(m, out, up, down, left, right, rho):
+        height, width = m.shape
+        for i in numba.prange(height):
+            u, d = up[i], down[i]
+            for j in range(width):
+                l, r = left[j], right[j]
+                dif = .25 * (_at(m, u, j) + _at(m, d, j) +
+                             _at(m, i, l) + _at(m, i, r))
+                out[i, j] = rho / 2 * (dif - dif * dif)
+
+    @numba.njit(parallel=True, cache=True)
+    def burgers_1d_kernel(u, con_constant, out):
+        n = u.shape[0]
+        for i in numba.prange(n):
+            l, c, r = u[(i - 1) % n], u[i], u[(i + 1) % n]
+            out[i] = (con_constant * c * (.5 * l - c + .5 * r) +
+                      (.25 * l + .5 * c + .25 * r))
+
+
+class NumbaBackend:
+    """
+    Three parallel sweeps per step (momentum, external flow, pressure) over
+    the solver's own arrays plus two scratch buffers.  Ensemble members are
+    swept one after the other, each with its own parameters.
+    """
+    def __init__(self, solver):
+        configure()
+        self.a = np.empty(solver.field_shape, dtype=solver.dtype)
+        self.q = np.empty(solver.field_shape, dtype=solver.dtype)
+        self._maps = None, None
+
+    def _neighbors(self, solver):
+        key, maps = self._maps
+        if key != (solver.shape, solver.bc):
+            height, width = solver.shape
+            maps = neighbors(height, solver.bc) + neighbors(width, solver.bc)
+            self._maps = (solver.shape, solver.bc), maps
+        return maps
+
+    def _members(self, solver):
+        """(index, viscosity, rho, damping, external_flow) of each member."""
+        parameters = (solver.viscosity, solver.rho, solver.damping,
+                      solver.external_flow)
+        if solver.momentum.ndim == 2:
+            yield ((),) + tuple(map(float, parameters))
+            return
+        for i in range(len(solver.momentum)):
+            yield ((i,),) + tuple(float(np.ravel(value)[i]) if np.ndim(value)
+                                  else float(value) for value in parameters)
+
+    def step(self, solver):
+        up, down, left, right = self._neighbors(solver)
+        m, p = solver.momentum, solver.pressure
+        flow = bool(np.any(solver.external_flow))
+        new_m = m if flow else self.a
+
+        members = list(self._members(solver))
+
+        with solver.stage('momentum'):
+            for index, viscosity, rho, damping, _ in members:
+                momentum_kernel(m[index], p[index], self.a[index],
+                                up, down, left, right, viscosity, rho, damping)
+
+        with solver.stage('flow'):
+            if flow:
+                for index, *_, external_flow in members:
+                    flow_kernel(self.a[index], m[index], left, right,
+                                external_flow)
+
+        with solver.stage('pressure'):
+            for index, _, rho, damping, _ in members:
+                if solver._pressure_solver is None:
+                    pressure_kernel(new_m[index], p[index], self.q[index],
+                                    up, down, left, right, rho, damping)
+                else:
+                    source_kernel(new_m[index], self.q[index],
+                                  up, down, left, right, rho)
+            if not flow:
+                m, self.a = self.a, m
+            if solver._pressure_solver is not None:
+                solver._pressure_solver.solve(self.q, self.q)
+            p, self.q = self.q, p
+
+        #Wall boundary conditions
+        with solver.stage('walls'):
+            walls = solver.wall_index
+            walls.fill(m, -solver.external_flow)
+            walls.fill(p, 0)
+
+        solver.momentum, solver.pressure = m, p
@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*
+"""
+Headless 1D solvers for the pre_navier_stokes demos.
+"""
+import warnings
+
+import numpy as np
+from .stencil import BURGERS, NONLINEAR_CONVECTION, diffusion
+
+
+class Equation1D:
+    """
+    A 1D field `u` of `length` cells, of `dtype`.  Subclasses set `program`,
+    a stencil.Program, or override `_step`.  `hooks` are called with the
+    solver after every step.
+    """
+    fields = 'u',
+    program = None
+
+    def __init__(self, length=512, dtype=np.float32):
+        self.length = length
+        self.dtype = np.dtype(dtype)
+        self.hooks = []
+        self._compiled = {}
+        self.reset()
+
+    def reset(self):
+        self.u = np.full(self.length, .5, dtype=self.dtype)
+        self.u[self.length // 4 : 3 * self.length // 4] = .75
+        self.steps = 0
+
+    def step(self, n=1):
+        for _ in range(n):
+            self._step()
+            self.steps += 1
+            for hook in self.hooks:
+                hook(self)
+        return self
+
+    def _step(self):
+        self.u = self._run(self.program)
+
+    def _run(self, program):
+        """Step `u` with `program`, compiled for this solver once."""
+        compiled = self._compiled.get(program)
+        if compiled is None:
+            compiled = program.compile(self.u.shape, self.dtype)
+            self._compiled[program] = compiled
+        return compiled.step(self.u, self)
+
+    def poke(self, x, value):
+        """Set the cells around `x` to `value`."""
+        self.u[x - 2:x + 3] = value
+
+
+class Diffusion1D(Equation1D):
+    kernels = [np.array([1., 0., 0.]),
+               np.array([.5, 0., .5]),
+               np.array([1/3, 1/3, 1/3]),
+               np.array([.25, .5, .25]),
+               np.array([.1, .2, .4, .2, .1])]
+    programs = [diffusion(kernel) for kernel in kernels]
+
+    def __init__(self, length=512, dtype=np.float32):
+        self.kernel = 1
+        super(Diffusion1D, self).__init__(length, dtype)
+
+    def reset(self):
+        super(Diffusion1D, self).reset()
+        self.damping = 1.
+
+    def _step(self):
+        self.u = self._run(self.programs[self.kernel])
+
+
+class Burgers1D(Equation1D):
+    """
+    `backend` is 'convolve' or 'numba' (which falls back to 'convolve' if numba
+    isn't installed).
+    """
+    program = BURGERS
+    con_constant = .75  #convection constant
+
+    def __init__(self, length=512, backend='convolve', dtype=np.float32):
+        if backend == 'numba':
+            #Imported only here, so other solvers never touch numba.
+            from . import numba_backend
+            if numba_backend.numba is None:
+                warnings.warn("numba is not installed; using the 'convolve' "
+                              "backend")
+                backend = 'convolve'
+            else:
+                numba_backend.configure()
+                self._kernel = numba_backend.burgers_1d_kernel
+        self.backend = backend
+        super(Burgers1D, self).__init__(length, dtype)
+
+    def reset(self):
+        super(Burgers1D, self).reset()
+        self._out = np.empty_like(self.u)
+
+    def _step(self):
+        if self.backend == 'numba':
+            self._kernel(self.u, self.con_constant, self._out)
+            self.u, self._out = self._out, self.u
+            return
+        super(Burgers1D, self)._step()
+
+
+class NonlinearConvection1D(Equation1D):
+    program = NONLINEAR_CONVECTION
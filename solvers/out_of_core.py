@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*
+"""
+Out-of-core backend for grids too big for memory.
+
+momentum and pressure live in memory-mapped files, double buffered, and the
+walls in a third.  A step streams the grid through in bands of `band` rows:
+each band is read together with three rows of overlap on either side -- one
+per stage, as every stage's 3x3 stencil reaches one row further -- into
+small halo-padded buffers, run through the fused stages, and its rows are
+written to the other pair of files.  Pages of a band are dropped from the
+process once it's done, so peak resident memory follows the band size, not
+the grid size.  (That needs madvise, i.e. Linux or another platform with
+MADV_DONTNEED and Python 3.8 or later; elsewhere pages are left to the
+kernel, which reclaims them from the page cache as memory runs short.)
+Rows are always whole, so columns get the exact bc; rows at the top and
+bottom of the grid get it through the halo as usual.  `reset` also goes a
+band at a time, so the fields are never whole in memory.
+
+The files are anonymous temporary files in `directory` (default: the
+system's temp directory), removed as soon as they're unmapped.  Put them on
+a disk with room for 5 grids of the solver's dtype -- not on a tmpfs, which
+lives in memory.  Use it as
+    NavierStokes(size, backend='out_of_core')
+or, to pick the band and the directory,
+    NavierStokes(size, backend=partial(OutOfCoreBackend, band=1024,
+                                       directory='/scratch'))
+Only single simulations with the 'relax' pressure update are supported, and
+storage must be the compute dtype.
+"""
+import mmap
+import tempfile
+
+import numpy as np
+from .backends import (fill_halo, flow_stage, full_window, interior,
+                       momentum_stage, pressure_stage)
+
+HALO = 3  #rows of overlap, one per stage
+PAGE = mmap.PAGESIZE
+CAN_RELEASE = hasattr(mmap, 'MADV_DONTNEED')
+
+
+def mapped(shape, dtype, directory=None):
+    """
+    A zeroed array memory-mapped to an anonymous file in `directory`; its
+    `base` is the mmap.mmap.
+    """
+    size = int(np.prod(shape)) * np.dtype(dtype).itemsize
+    with tempfile.TemporaryFile(dir=directory) as file:
+        file.truncate(size)
+        #The mapping keeps the file alive after it's closed.
+        memory = mmap.mmap(file.fileno(), size)
+    return np.ndarray(shape, dtype=dtype, buffer=memory)
+
+def release(field, start, stop):
+    """
+    Drop the pages holding rows [start, stop) of `field`, from `mapped`,
+    from the process.  They stay in the file (or the page cache) and fault
+    back in when touched.
+    """
+    if not CAN_RELEASE:
+        return
+    memory = field.base
+    row_bytes = field.strides[0]
+    begin = start * row_bytes // PAGE * PAGE
+    end = min(-(-stop * row_bytes // PAGE) * PAGE, len(memory))
+    if end > begin:
+        memory.madvise(mmap.MADV_DONTNEED, begin, end - begin)
+
+def bands(height, band):
+    """(row_start, row_stop) of each band."""
+    return [(start, min(start + band, height))
+            for start in range(0, height, band)]
+
+
+class OutOfCoreBackend:
+    """
+    Streams the solver's fields, kept in memory-mapped files, through the
+    fused stages `band` rows at a time.  The solver's momentum, pressure and
+    walls become the mapped arrays; arrays put in their place, e.g. by
+    `checkpoint.load`, are copied in, band by band, at the next step.
+    """
+    def __init__(self, solver, band=256, directory=None):
+        if solver._pressure_solver is not None or solver.batch is not None:
+            raise ValueError("the out-of-core backend only supports single "
+                             "simulations with the 'relax' pressure update")
+        if solver.storage != solver.dtype:
+            raise ValueError("the out-of-core backend keeps fields in the "
+                             "compute dtype; leave storage unset")
+        height, width = shape = solver.shape
+        dtype = solver.dtype
+        self.band = min(band, height)
+        self.bands = bands(height, self.band)
+        self.momenta = [mapped(shape, dtype, directory) for _ in range(2)]
+        self.pressures = [mapped(shape, dtype, directory) for _ in range(2)]
+        self.walls = mapped(shape, dtype, directory)
+        self.parity = 0
+
+        local_shape = self.band + 2 * HALO + 2, width + 2
+        self.m, self.p, self.a, self.q = (np.zeros(local_shape, dtype=dtype)
+                                          for _ in range(4))
+        self.tmp = [np.empty((self.band + 2 * HALO, width), dtype=dtype)
+                    for _ in range(2)]
+        self.momentum = self.pressure = None
+
+    def reset(self, solver):
+        """NavierStokes.reset for the mapped fields, a band at a time."""
+        rows, columns = solver.start_block
+        momentum = self.momenta[self.parity]
+        pressure = self.pressures[self.parity]
+        for start, stop in self.bands:
+            block = (slice(max(start, rows.start), min(stop, rows.stop)),
+                     columns)
+            for field, value in (momentum, .04), (pressure, 1):
+                field[start:stop] = 0
+                field[block] = value
+                release(field, start, stop)
+            self.walls[start:stop] = 0
+            release(self.walls, start, stop)
+        solver.walls = self.walls
+        self._publish(solver)
+
+    def _copy_in(self, source, target):
+        for start, stop in self.bands:
+            target[start:stop] = source[start:stop]
+            release(target, start, stop)
+
+    def _bind(self, solver):
+        self._copy_in(solver.momentum, self.momenta[self.parity])
+        self._copy_in(solver.pressure, self.pressures[self.parity])
+        if solver.walls is not self.walls:
+            #Index the walls where they are, rather than paging the copy in.
+            index = solver.wall_index
+            self._copy_in(solver.walls, self.walls)
+            solver.walls = self.walls
+            index.moved(self.walls)
+        self._publish(solver)
+
+    def _publish(self, solver):
+        solver.momentum = self.momentum = self.momenta[self.parity]
+        solver.pressure = self.pressure = self.pressures[self.parity]
+
+    def _gather(self, field, start, stop, out):
+        """Rows [start, stop) of `field`, wrapping around, into `out`."""
+        height = field.shape[0]
+        if start >= 0 and stop <= height:
+            out[...] = field[start:stop]
+            return
+        rows = np.arange(start, stop) % height
+        np.take(field, rows, axis=0, out=out)
+
+    def step(self, solver):
+        if solver.momentum is not self.momentum or\
+           solver.pressure is not self.pressure or\
+           solver.walls is not self.walls:
+            self._bind(solver)
+
+        bc = solver.bc
+        rho = solver.rho
+        damping = solver.damping
+        external_flow = solver.external_flow
+        height = solver.shape[0]
+        momentum, pressure = self.momentum, self.pressure
+        new_momentum = self.momenta[1 - self.parity]
+        new_pressure = self.pressures[1 - self.parity]
+
+        with solver.stage('bands'):
+            for start, stop in self.bands:
+                if bc == 'wrap':
+                    low, high = start - HALO, stop + HALO
+                else:
+                    #At the grid's edges the halo gets the bc instead.
+                    low, high = max(start - HALO, 0), min(stop + HALO, height)
+                rows = high - low
+                m, p, a, q = (buffer[:rows + 2]
+                              for buffer in (self.m, self.p, self.a, self.q))
+                tmp = [t[:rows] for t in self.tmp]
+                self._gather(momentum, low, high, interior(m))
+                self._gather(pressure, low, high, interior(p))
+
+                #The rows next to other bands go stale a row per stage; the
+                #band's own rows stay exact.
+                window = full_window(m)
+                fill_halo(m, bc)
+                fill_halo(p, bc)
+                momentum_stage(m, p, a, tmp, window, solver.viscosity, rho,
+                               damping)
+                if external_flow:
+                    fill_halo(a, bc)
+                    flow_stage(a, m, window, external_flow)
+                else:
+                    m, a = a, m
+                fill_halo(m, bc)
+                pressure_stage(m, p, q, tmp, window, rho, damping)
+
+                offset = start - low
+                new_momentum[start:stop] = interior(m)[offset:offset + stop -
+                                                       start]
+                new_pressure[start:stop] = interior(q)[offset:offset + stop -
+                                                       start]
+                for field in momentum, pressure, new_momentum, new_pressure:
+                    release(field, max(low, 0), min(high, height))
+
+        self.parity = 1 - self.parity
+        self._publish(solver)
+
+        #Wall boundary conditions
+        with solver.stage('walls'):
+            walls = solver.wall_index
+            walls.fill(self.momentum, -external_flow)
+            walls.fill(self.pressure, 0)
@@ -0,0 +1,350 @@
+# -*- coding: utf-8 -*
+"""
+Pressure solvers for the 2D Navier_Stokes solver.
+
+By default ('relax') pressure gets a single relaxation sweep per step,
+
+    pressure = damping * (poi(pressure) + source),
+
+so pressure information only travels one cell per step.  The solvers here
+instead solve for the fixed point of that sweep every step:
+
+    pressure - damping * poi(pressure) = damping * source
+
+'fft' solves it exactly with FFTs and needs bc='wrap'; with walls it hands
+over to 'multigrid'.  'multigrid' solves it to
+`NavierStokes.pressure_tolerance` with geometric multigrid V-cycles, which
+works with any bc and with walls.
+"""
+import warnings
+
+import numpy as np
+
+from .backends import fill_halo, full_window, interior, shifted
+
+
+class SpectralSolver:
+    """
+    Exact periodic pressure solve in O(N log N).  poi is diagonal in Fourier
+    space, with eigenvalues (cos(ky) + cos(kx)) / 2, so each mode is just
+    scaled by damping / (1 - damping * eigenvalue).  The scaling is cached per
+    grid shape and damping.
+
+    Walls don't fit the diagonal form: zeroing pressure on them after an
+    exact solve feeds back into the next step's source and blows up within a
+    few steps.  So while there are any walls the solve is handed to a
+    MultigridSolver, which holds them at 0 as part of the solve.
+    """
+    def __init__(self, solver):
+        self.solver = solver
+        self._check()
+        self._key = None
+        self._multigrid = None
+
+    def _check(self):
+        if self.solver.bc != 'wrap':
+            raise ValueError("the 'fft' pressure solver needs bc='wrap', "
+                             "not {!r}".format(self.solver.bc))
+
+    def _transfer(self, shape, damping):
+        key = shape, tuple(np.ravel(damping))
+        if self._key != key:
+            height, width = shape
+            ky = 2 * np.pi * np.fft.fftfreq(height)[:, None]
+            kx = 2 * np.pi * np.fft.rfftfreq(width)
+            denominator = 1 - damping * (np.cos(ky) + np.cos(kx)) / 2
+            #With damping == 1 the mean mode is free; keep it at 0.  A
+            #(batch, 1, 1) damping gives a transfer per ensemble member.
+            with np.errstate(divide='ignore'):
+                transfer = np.where(denominator != 0,
+                                    damping / denominator, 0)
+            self._key = key
+            self.transfer = transfer.astype(self.solver.dtype)
+        return self.transfer
+
+    def solve(self, source, out):
+        """Write the pressure for `source` into `out`."""
+        self._check()
+        if len(self.solver.wall_index):
+            if self._multigrid is None:
+                self._multigrid = MultigridSolver(self.solver)
+            return self._multigrid.solve(source, out)
+        shape = source.shape[-2:]
+        transfer = self._transfer(shape, self.solver.damping)
+        modes = np.fft.rfft2(source)
+        modes *= transfer
+        out[...] = np.fft.irfft2(modes, s=shape)
+        return out
+
+
+def pairs(fine, coarse):
+    """
+    How `fine` cells along an axis map onto `coarse` ones, `fine` // 2 of
+    them: (runs, extra), where each run (fine_start, coarse_start, count)
+    gives `count` coarse cells two children each, and `extra`, for odd
+    `fine`, is the odd cell out, a third child of the middle coarse cell.
+    """
+    if fine == 2 * coarse:
+        return [(0, 0, coarse)], None
+    middle = coarse // 2
+    extra = 2 * middle + 2
+    return [(0, 0, middle + 1),
+            (extra + 1, middle + 1, coarse - middle - 1)], extra
+
+def parents(index, extra):
+    """The coarse cells of the fine cells `index` along an axis, see pairs."""
+    if extra is None:
+        return index // 2
+    return (index - (index >= extra)) // 2
+
+
+class Level:
+    """
+    Buffers for one grid of the multigrid hierarchy.  `shape` may have a
+    leading ensemble axis.  `rows` and `cols` are `pairs` from the finer
+    level along each axis.
+    """
+    def __init__(self, shape, dtype=np.float32):
+        height, width = shape[-2:]
+        self.shape = shape
+        self.u = np.zeros(shape[:-2] + (height + 2, width + 2), dtype=dtype)
+        self.f = np.zeros(shape, dtype=dtype)
+        self.r = np.zeros(shape, dtype=dtype)
+        self.tmp = np.zeros(shape, dtype=dtype)
+        rows, cols = np.indices((height, width))
+        self.colors = (rows + cols) % 2 == 0, (rows + cols) % 2 == 1
+        self.window = full_window(self.u)
+        self.walls = None
+        self.weights = None  #of the children of each cell, when restricting
+        self.rows = self.cols = None
+
+
+class MultigridSolver:
+    """
+    Geometric multigrid for
+
+        c0 * p - c1 * (cross(p) - 4 * p) = f,
+
+    where c0 = 1 - damping, c1 = damping / 4, f = damping * source and cross
+    sums the four neighbors.  Each level halves the grid, rounding odd sides
+    down, averaging residuals down over each cell's children and
+    interpolating corrections back up bilinearly; c1 is divided by 4 per
+    level as the grid spacing doubles.  Along an odd side the middle coarse
+    row or column takes three fine ones, so every level covers the same
+    domain, the bc's edges (or period) stay where the fine grid has them and
+    the odd cell is as far from them as it gets.  Red-black Gauss-Seidel
+    smooths on every level.
+
+    Halos are filled with the solver's bc on every level.  Walls are held at
+    0 pressure; a coarse cell is a wall if any of its children is, so coarse
+    corrections stay clear of the cells around walls.  Each level's walls are
+    kept as index arrays, rebuilt only when the walls change.
+    V-cycles are run, warm started from the previous step's pressure, until
+    the residual is below `pressure_tolerance` relative to f, or for at most
+    `max_cycles`: then `converged` is False and a RuntimeWarning is issued.
+    A zero f has the solution 0 and takes no cycles.  Costs O(N) per cycle
+    whatever the resolution.
+    """
+    min_size = 4
+    pre_smooth = post_smooth = 2
+    coarse_smooth = 32
+    max_cycles = 20
+
+    def __init__(self, solver):
+        self.solver = solver
+        self.levels = []
+        self.cycles = 0
+        self.converged = True
+        self._wall_cells = None
+
+    def _build(self, shape):
+        dtype = self.solver.dtype
+        levels = [Level(shape, dtype)]
+        height, width = shape[-2:]
+        while min(height, width) >= 2 * self.min_size:
+            level = Level(shape[:-2] + (height // 2, width // 2), dtype)
+            level.rows = pairs(height, height // 2)
+            level.cols = pairs(width, width // 2)
+            children = np.full((height // 2, width // 2), 4.)
+            if height % 2:
+                children[height // 4] *= 1.5
+            if width % 2:
+                children[:, width // 4] *= 1.5
+            if (children == 4).all():
+                level.weights = .25
+            else:
+                level.weights = (1 / children).astype(dtype)
+            height, width = height // 2, width // 2
+            levels.append(level)
+        self.levels = levels
+        self._wall_cells = None
+
+    def _walls(self):
+        index = self.solver.wall_index
+        if self._wall_cells is index.cells:
+            return
+        self._wall_cells = index.cells
+        walls = index.index if len(index) else None
+        for level, coarse in zip(self.levels, self.levels[1:] + [None]):
+            level.walls = walls
+            if walls is None or coarse is None:
+                continue
+            *members, rows, cols = walls
+            rows = parents(rows, coarse.rows[1])
+            cols = parents(cols, coarse.cols[1])
+            cells = np.unique(np.ravel_multi_index(
+                tuple(members) + (rows, cols), coarse.shape))
+            walls = np.unravel_index(cells, coarse.shape)
+
+    def _smooth(self, level, c0, c1, sweeps):
+        u, tmp = interior(level.u), level.tmp
+        at = shifted(level.u, level.window)
+        bc = self.solver.bc
+        for _ in range(sweeps):
+            for color in level.colors:
+                fill_halo(level.u, bc)
+                np.add(at(-1, 0), at(1, 0), out=tmp)
+                tmp += at(0, -1)
+                tmp += at(0, 1)
+                tmp *= c1
+                tmp += level.f
+                tmp /= c0 + 4 * c1
+                np.copyto(u, tmp, where=color)
+                if level.walls is not None:
+                    u[level.walls] = 0
+
+    def _residual(self, level, c0, c1):
+        r = level.r
+        at = shifted(level.u, level.window)
+        fill_halo(level.u, self.solver.bc)
+        np.add(at(-1, 0), at(1, 0), out=r)
+        r += at(0, -1)
+        r += at(0, 1)
+        r *= c1
+        r += level.f
+        np.multiply(at(0, 0), c0 + 4 * c1, out=level.tmp)
+        r -= level.tmp
+        if level.walls is not None:
+            r[level.walls] = 0
+        return r
+
+    def _prolong(self, coarse, fine):
+        """Add the bilinear interpolation of coarse.u to fine.u."""
+        fill_halo(coarse.u, self.solver.bc)
+        at = shifted(coarse.u, coarse.window)
+        correction = fine.tmp
+        (row_runs, extra_row), (col_runs, extra_col) = coarse.rows, coarse.cols
+        for fine_row, row, rows in row_runs:
+            for fine_col, col, cols in col_runs:
+                parent = lambda dy, dx: at(dy, dx)[..., row:row + rows,
+                                                   col:col + cols]
+                for a, da in ((0, -1), (1, 1)):
+                    for b, db in ((0, -1), (1, 1)):
+                        child = correction[
+                            ..., fine_row + a:fine_row + 2 * rows:2,
+                            fine_col + b:fine_col + 2 * cols:2]
+                        np.multiply(parent(0, 0), 9 / 16, out=child)
+                        child += 3 / 16 * parent(da, 0)
+                        child += 3 / 16 * parent(0, db)
+                        child += 1 / 16 * parent(da, db)
+        #The odd cell out gets the mean of its neighbors along that axis.
+        if extra_row is not None:
+            middle = correction[..., extra_row, :]
+            np.add(correction[..., extra_row - 1, :],
+                   correction[..., extra_row + 1, :], out=middle)
+            middle *= .5
+        if extra_col is not None:
+            middle = correction[..., extra_col]
+            np.add(correction[..., extra_col - 1],
+                   correction[..., extra_col + 1], out=middle)
+            middle *= .5
+        interior(fine.u)[...] += correction
+
+    def _restrict(self, r, coarse):
+        """coarse.f = the mean of the children of each coarse cell in `r`."""
+        f = coarse.f
+        (row_runs, extra_row), (col_runs, extra_col) = coarse.rows, coarse.cols
+        for fine_row, row, rows in row_runs:
+            for fine_col, col, cols in col_runs:
+                block = f[..., row:row + rows, col:col + cols]
+                children = r[..., fine_row:fine_row + 2 * rows,
+                             fine_col:fine_col + 2 * cols]
+                np.copyto(block, children[..., 0::2, 0::2])
+                block += children[..., 1::2, 0::2]
+                block += children[..., 0::2, 1::2]
+                block += children[..., 1::2, 1::2]
+        #The odd cell out goes to the middle coarse row or column.
+        if extra_row is not None:
+            middle = f[..., extra_row // 2 - 1, :]
+            for fine_col, col, cols in col_runs:
+                children = r[..., extra_row, fine_col:fine_col + 2 * cols]
+                middle[..., col:col + cols] += children[..., 0::2]
+                middle[..., col:col + cols] += children[..., 1::2]
+        if extra_col is not None:
+            middle = f[..., extra_col // 2 - 1]
+            for fine_row, row, rows in row_runs:
+                children = r[..., fine_row:fine_row + 2 * rows, extra_col]
+                middle[..., row:row + rows] += children[..., 0::2]
+                middle[..., row:row + rows] += children[..., 1::2]
+            if extra_row is not None:
+                f[..., extra_row // 2 - 1, extra_col // 2 - 1] += r[
+                    ..., extra_row, extra_col]
+        f *= coarse.weights
+
+    def _vcycle(self, depth, c0, c1):
+        level = self.levels[depth]
+        if depth == len(self.levels) - 1:
+            self._smooth(level, c0, c1, self.coarse_smooth)
+            return
+
+        self._smooth(level, c0, c1, self.pre_smooth)
+        r = self._residual(level, c0, c1)
+        coarse = self.levels[depth + 1]
+        self._restrict(r, coarse)
+        coarse.u[:] = 0
+        self._vcycle(depth + 1, c0, c1 / 4)
+        self._prolong(coarse, level)
+        self._smooth(level, c0, c1, self.post_smooth)
+
+    def solve(self, source, out):
+        """Write the pressure for `source` into `out`."""
+        shape = source.shape
+        if not self.levels or self.levels[0].shape != shape:
+            self._build(shape)
+        self._walls()
+
+        damping = self.solver.damping
+        c0, c1 = 1 - damping, damping / 4
+        top = self.levels[0]
+        np.multiply(source, damping, out=top.f)
+
+        #Every ensemble member has to converge relative to its own source.
+        axes = -2, -1
+        scale = np.abs(top.f).max(axis=axes, keepdims=True)
+        if not scale.any():
+            top.u[...] = 0
+            self.cycles, self.converged = 0, True
+            out[...] = 0
+            return out
+        if top.f.ndim > 2:
+            #Members with a zero f stay exactly 0, with a zero residual.
+            top.u[(scale == 0).ravel()] = 0
+        tolerance = self.solver.pressure_tolerance * scale
+        self.converged = False
+        for self.cycles in range(1, self.max_cycles + 1):
+            self._vcycle(0, c0, c1)
+            residual = np.abs(self._residual(top, c0, c1))
+            if (residual.max(axis=axes, keepdims=True) <= tolerance).all():
+                self.converged = True
+                break
+        if not self.converged:
+            warnings.warn("multigrid pressure solve didn't converge in {} "
+                          "cycles".format(self.max_cycles), RuntimeWarning)
+
+        out[...] = interior(top.u)
+        return out
+
+
+PRESSURE_SOLVERS = {'relax': None,
+                    'fft': SpectralSolver,
+                    'multigrid': MultigridSolver}
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*
+"""
+Opt-in per-stage timing of the 2D Navier_Stokes step (and whatever else wants
+to be timed alongside it, e.g. drawing and blitting in the viewer).
+
+    solver.profiler = Profiler()
+    solver.step(100)
+    print(solver.profiler.report())
+
+The backends wrap each stage of a step in `solver.stage(name)`, which costs
+next to nothing while `solver.profiler` is None.  Timings are kept over a
+rolling window of the last `window` calls per stage.  With allocations=True
+tracemalloc also measures the peak bytes each stage allocates on top of what
+was already held -- its temporaries -- at a noticeable cost to speed.  That's
+bytes, not a count of allocations: a few large temporaries are what slow a
+numpy stage down, and their size is what tracemalloc can tell cheaply.
+tracemalloc is process-wide, so only measure allocations of stages that run
+in one thread.  Before Python 3.9 tracemalloc can't reset its peak, so it's
+restarted for each stage instead, which forgets what was traced before.
+"""
+import time
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class Profiler:
+    def __init__(self, window=120, allocations=False):
+        self.window = window
+        self.allocations = allocations
+        self.times = {}
+        self.allocated = {}
+
+    def _samples(self, samples, name):
+        if name not in samples:
+            samples[name] = deque(maxlen=self.window)
+        return samples[name]
+
+    @contextmanager
+    def stage(self, name):
+        """Time the block as stage `name`."""
+        tracing = self.allocations
+        if tracing:
+            if hasattr(tracemalloc, 'reset_peak'):
+                if not tracemalloc.is_tracing():
+                    tracemalloc.start()
+                current, _ = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+            else:
+                tracemalloc.stop()
+                tracemalloc.start()
+                current = 0
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._samples(self.times, name).append(time.perf_counter() - start)
+            if tracing:
+                _, peak = tracemalloc.get_traced_memory()
+                self._samples(self.allocated, name).append(peak - current)
+
+    def reset(self):
+        self.times.clear()
+        self.allocated.clear()
+
+    def summary(self):
+        """
+        {stage: {'mean': seconds, 'max': seconds, 'bytes': mean peak bytes
+        allocated, or None}} over the window.
+        """
+        summary = {}
+        #Copies, as stages may be timed in another thread meanwhile.
+        for name, times in list(self.times.items()):
+            times = list(times)
+            allocated = list(self.allocated.get(name, ()))
+            summary[name] = {'mean': np.mean(times), 'max': np.max(times),
+                             'bytes': (np.mean(allocated) if allocated
+                                       else None)}
+        return summary
+
+    def report(self):
+        """The summary as a small table, slowest stage first."""
+        summary = self.summary()
+        lines = ['{:<10} {:>8} {:>8} {:>9}'.format('stage', 'mean ms',
+                                                   'max ms', 'peak KiB')]
+        for name in sorted(summary, key=lambda name: -summary[name]['mean']):
+            stats = summary[name]
+            allocated = ('-' if stats['bytes'] is None else
+                         '{:.1f}'.format(stats['bytes'] / 2**10))
+            lines.append('{:<10} {:>8.3f} {:>8.3f} {:>9}'.format(
+                         name, stats['mean'] * 1e3, stats['max'] * 1e3,
+                         allocated))
+        return '\n'.join(lines)
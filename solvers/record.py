@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*
+"""
+Streaming time-series output for every solver in this package.
+
+A Recorder is a solver hook that snapshots every `every`-th frame of the
+solver's fields and hands it to a background thread through a bounded queue.
+The thread stacks frames into chunks of `chunk` frames along a leading time
+axis and writes each as one compressed .npz file (chunk_000000.npz, ...), so
+the store is appendable: recording into an existing directory just adds
+chunks.  If the writer falls behind, frames are dropped (and counted) rather
+than stalling the step loop.
+
+    recorder = Recorder('run.frames', every=10)
+    solver.hooks.append(recorder)
+    solver.step(10000)
+    recorder.close()
+    frames = read('run.frames')  #{'steps': ..., 'pressure': ..., ...}
+
+Run from the repository root to record headless, e.g.:
+    python -m solvers.record NavierStokes --steps 5000 --every 10 run.frames
+"""
+import argparse
+import glob
+import os
+import queue
+import threading
+
+import numpy as np
+from .navier_stokes import NavierStokes
+from .one_dimensional import Diffusion1D, Burgers1D, NonlinearConvection1D
+from .two_dimensional import (Burgers2D, Convection2D, Diffusion2D, Laplace2D,
+                              NonlinearConvection2D, Poisson2D)
+
+SOLVERS = {solver.__name__: solver for solver in
+           (NavierStokes, Diffusion1D, Burgers1D, NonlinearConvection1D,
+            Burgers2D, Convection2D, Diffusion2D, Laplace2D,
+            NonlinearConvection2D, Poisson2D)}
+
+
+class Recorder:
+    """
+    Streams `fields` (default: the solver's own `fields`) to the directory
+    `path`.  `dropped` counts frames lost to a full queue; with drop=False
+    the solver waits for the writer instead.  Call `close` to write the last,
+    partial chunk.
+    """
+    def __init__(self, path, every=1, fields=None, chunk=64, queue_size=16,
+                 drop=True):
+        self.path = os.fspath(path)
+        self.every = every
+        self.fields = fields
+        self.chunk = chunk
+        self.drop = drop
+        self.dropped = 0
+        self.error = None
+        os.makedirs(self.path, exist_ok=True)
+        self.chunks = len(chunk_files(self.path))
+        self.queue = queue.Queue(queue_size)
+        self.thread = threading.Thread(target=self._write, daemon=True)
+        self.thread.start()
+
+    def __call__(self, solver):
+        if solver.steps % self.every:
+            return
+        names = self.fields or solver.fields
+        frame = solver.steps, {name: np.array(getattr(solver, name))
+                               for name in names}
+        try:
+            self.queue.put(frame, block=not self.drop)
+        except queue.Full:
+            self.dropped += 1
+
+    def _write(self):
+        frames = []
+        while True:
+            frame = self.queue.get()
+            if frame is not None:
+                frames.append(frame)
+            if frames and (frame is None or len(frames) == self.chunk):
+                try:
+                    self._flush(frames)
+                except Exception as error:
+                    self.error = error
+                frames = []
+            if frame is None:
+                return
+
+    def _flush(self, frames):
+        arrays = {name: np.stack([fields[name] for _, fields in frames])
+                  for name in frames[0][1]}
+        arrays['steps'] = np.array([steps for steps, _ in frames])
+        name = os.path.join(self.path, 'chunk_{:06d}'.format(self.chunks))
+        #Readers never see a partially written chunk.
+        np.savez_compressed(name + '.partial.npz', **arrays)
+        os.replace(name + '.partial.npz', name + '.npz')
+        self.chunks += 1
+
+    def close(self):
+        """Write whatever is queued and stop the writer thread."""
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+
+def chunk_files(path):
+    return sorted(glob.glob(os.path.join(path, 'chunk_[0-9]*[0-9].npz')))
+
+def read(path, fields=None):
+    """
+    The frames recorded in `path`, as a dict of arrays with a leading time
+    axis, one per field plus 'steps'.
+    """
+    arrays = {}
+    for file in chunk_files(os.fspath(path)):
+        with np.load(file) as chunk:
+            names = fields or [name for name in chunk.files if name != 'steps']
+            for name in ['steps'] + list(names):
+                arrays.setdefault(name, []).append(chunk[name])
+    return {name: np.concatenate(chunks) for name, chunks in arrays.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('solver', choices=SOLVERS)
+    parser.add_argument('path', help='directory to record into')
+    parser.add_argument('--steps', type=int, default=1000)
+    parser.add_argument('--every', type=int, default=10)
+    parser.add_argument('--chunk', type=int, default=64)
+    args = parser.parse_args()
+
+    solver = SOLVERS[args.solver]()
+    #Headless there's no frame rate to keep up with, so don't drop frames.
+    recorder = Recorder(args.path, args.every, chunk=args.chunk, drop=False)
+    solver.hooks.append(recorder)
+    solver.step(args.steps)
+    recorder.close()
+    print('recorded {} frames of {} into {}'.format(
+        args.steps // args.every, ', '.join(solver.fields), args.path))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*
+"""
+Colour the solvers' fields into persistent uint8 RGB framebuffers.
+
+Fields are mapped through a 256 entry colormap lookup table, written in place
+into a preallocated (height, width, 3) buffer, so drawing a frame allocates
+nothing and uploads a quarter of the bytes of a float RGB texture.  Pass
+`Framebuffer.pixels` (a flat view of the buffer) straight to
+`Texture.blit_buffer(..., colorfmt='rgb', bufferfmt='ubyte')`.
+
+A Framebuffer can also be smaller than the field by an integer `factor`: each
+factor x factor block of cells becomes one pixel, so a big simulation only
+uploads a display-sized texture.
+
+1D fields are drawn as a `Polyline`: an interleaved x, y vertex buffer whose x
+coordinates are only recomputed when the widget is resized.
+"""
+import numpy as np
+
+WALL_COLOR = np.array([.717, .176, .07])
+
+
+def pressure_colors(values):
+    """The Navier_Stokes palette: green and blue rise with pressure."""
+    return np.zeros_like(values), .6549 * values, (values + 1) * .5
+
+def blue(values):
+    return np.zeros_like(values), np.zeros_like(values), values
+
+def colormap(colors, lo, hi, size=256):
+    """
+    Lookup table of `size` uint8 rgb colors for values evenly spaced from `lo`
+    to `hi`.  `colors` maps an array of values to (red, green, blue) arrays in
+    [0, 1]; out of range channels are clipped like the gpu would.
+    """
+    values = np.linspace(lo, hi, size)
+    rgb = np.clip(np.stack(colors(values), axis=-1), 0, 1)
+    return to_ubyte(rgb)
+
+def to_ubyte(rgb):
+    return (np.asarray(rgb) * 255).round().astype(np.uint8)
+
+def downsample(field, factor, out, average=True):
+    """
+    Reduce each `factor` x `factor` block of the 2D `field` to one value of
+    `out`: its mean, or with average=False just its corner cell, which is
+    cheaper but aliases.  Cells past the last whole block are ignored.
+    """
+    height, width = out.shape
+    field = field[:height * factor, :width * factor]
+    np.copyto(out, field[::factor, ::factor], casting='unsafe')
+    if not average:
+        return out
+    #factor**2 strided adds beat a reduction over a (h, f, w, f) view, and
+    #allocate nothing.
+    for row in range(factor):
+        for col in range(factor):
+            if row or col:
+                out += field[row::factor, col::factor]
+    out /= factor * factor
+    return out
+
+
+class Framebuffer:
+    """
+    A (height, width, 3) uint8 rgb buffer that fields of shape `shape` are
+    drawn into in place, `factor` times smaller along each side (see
+    `downsample`; `average` picks block means or strided cells).  Values
+    outside of [lo, hi] are clamped to the ends of the colormap, and NaNs get
+    the color of `lo`.
+    """
+    def __init__(self, shape, colors=blue, lo=0., hi=1., size=256, factor=1,
+                 average=True):
+        self.factor = factor
+        self.average = average
+        shape = tuple(side // factor for side in shape)
+        self.shape = shape
+        self.lut = colormap(colors, lo, hi, size)
+        self.lo = lo
+        self.scale = (size - 1) / (hi - lo)
+        self.size = size
+        self.rgb = np.zeros(shape + (3,), dtype=np.uint8)
+        self.pixels = self.rgb.reshape(-1)
+        self._values = np.empty(shape, dtype=np.float32)
+        self._indices = np.empty(shape, dtype=np.intp)
+
+    def draw(self, field, walls=None, wall_color=WALL_COLOR):
+        """
+        Color `field` into the buffer.  Cells selected by `walls`, a boolean
+        mask or, cheaper for a few cells, an index like
+        `NavierStokes.wall_index.index`, are painted `wall_color`; when
+        downsampling, a pixel is a wall if any cell of its block is.  Returns
+        the flat pixel view.
+        """
+        values = self._values
+        if self.factor != 1:
+            field = downsample(field, self.factor, values, self.average)
+            walls = self._walls(walls)
+        np.subtract(field, self.lo, out=values)
+        values *= self.scale
+        values += .5
+        np.clip(values, 0, self.size - 1, out=values)
+        #NaNs (a blown up simulation) would cast to a wild index.
+        np.nan_to_num(values, copy=False, nan=0.)
+        np.copyto(self._indices, values, casting='unsafe')
+        np.take(self.lut, self._indices, axis=0, out=self.rgb)
+
+        if walls is not None:
+            self.rgb[walls] = to_ubyte(wall_color)
+        return self.pixels
+
+    def _walls(self, walls):
+        """`walls` of the field as walls of the downsampled buffer."""
+        if walls is None:
+            return None
+        factor = self.factor
+        height, width = self.shape
+        if isinstance(walls, tuple):
+            rows, cols = walls[-2:]
+            inside = (rows < height * factor) & (cols < width * factor)
+            return rows[inside] // factor, cols[inside] // factor
+        walls = walls[:height * factor, :width * factor]
+        return walls.reshape(height, factor, width, factor).any(axis=(1, 3))
+
+
+class Polyline:
+    """
+    Interleaved x, y vertices of a line through a 1D field.
+
+    When the field has more than two cells per pixel column it's reduced to
+    the min/max envelope of each column, so the number of vertices handed to
+    kivy is bounded by the widget's width rather than the field's length.
+    """
+    def __init__(self):
+        self._layout = None
+
+    def _resize(self, length, width):
+        columns = max(int(width), 1)
+        if length > 2 * columns:
+            #Two vertices, min and max, per pixel column.
+            self.starts = np.unique(np.arange(columns) * length // columns)
+            x = np.repeat(self.starts * width / length, 2)
+        else:
+            self.starts = None
+            x = np.arange(length) * width / length
+        self.points = np.zeros(2 * len(x))
+        self.points[0::2] = x
+        self.y = self.points[1::2]
+        self._layout = length, width
+
+    def draw(self, field, width, height):
+        """
+        Scale `field` to `height` and return the vertices as a list for
+        `Line.points`.
+        """
+        if self._layout != (len(field), width):
+            self._resize(len(field), width)
+
+        y = self.y
+        if self.starts is None:
+            np.multiply(field, height, out=y)
+        else:
+            np.minimum.reduceat(field, self.starts, out=y[0::2])
+            np.maximum.reduceat(field, self.starts, out=y[1::2])
+            y *= height
+        return self.points.tolist()
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*
+"""
+Run a solver in its own thread, decoupled from the display.
+
+numpy and scipy release the GIL inside their loops, so a worker thread can
+step the solver while the UI thread stays responsive.  The worker runs
+`steps_per_frame` steps, draws the result into the back of two framebuffers
+and swaps them; the viewer only ever blits the front one, whenever it likes.
+Anything that touches the solver from the UI (pokes, walls, reset) is queued
+with `call` and run by the worker between frames.
+
+With a Substepper the number of steps per frame instead follows the real time
+that has passed, so the simulation runs at the same speed whatever the frame
+rate.
+"""
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+
+class Substepper:
+    """
+    Chooses how many steps to run for `dt` seconds of real time so the solver
+    advances `steps_per_second` steps per second, carrying fractions of a
+    step over to the next frame.  Two caps keep a frame bounded:
+
+      - a CFL-like one: at most max_cells / max|field| steps, so nothing
+        moves much more than `max_cells` cells between frames;
+      - a wall-time one: at most as many steps as fit in `budget` seconds at
+        the measured cost per step.
+
+    Steps cut by a cap are dropped rather than owed (and counted in
+    `dropped`), so under load the simulation slows down gracefully instead of
+    falling further and further behind.  `field` None skips the CFL cap.
+    """
+    def __init__(self, steps_per_second=120, max_cells=8., budget=1 / 60,
+                 field='momentum'):
+        self.steps_per_second = steps_per_second
+        self.max_cells = max_cells
+        self.budget = budget
+        self.field = field
+        self.owed = 0.  #fraction of a step carried over
+        self.cost = None  #seconds per step, a moving average
+        self.dropped = 0
+
+    def __call__(self, solver, dt):
+        """The number of steps to run for `dt` seconds."""
+        owed = self.owed + dt * self.steps_per_second
+        steps = int(owed)
+        self.owed = owed - steps
+        limit = steps
+        if steps and self.field is not None:
+            speed = np.abs(getattr(solver, self.field)).max()
+            if speed > 0:
+                limit = min(limit, max(1, int(self.max_cells / speed)))
+        if steps and self.cost:
+            limit = min(limit, max(1, int(self.budget / self.cost)))
+        if limit < steps:
+            self.dropped += steps - limit
+            self.owed = 0.
+        return limit
+
+    def run(self, solver, dt):
+        """Run the steps for `dt` seconds, timing them; returns how many."""
+        steps = self(solver, dt)
+        if steps:
+            start = time.perf_counter()
+            solver.step(steps)
+            cost = (time.perf_counter() - start) / steps
+            if self.cost is not None:
+                cost = .8 * self.cost + .2 * cost
+            self.cost = cost
+        return steps
+
+    def wait(self):
+        """Seconds until the next step is due."""
+        return (1 - self.owed) / self.steps_per_second
+
+
+class SimulationThread:
+    """
+    Steps `solver` in a daemon thread.  After every `steps_per_frame` steps
+    `draw(solver, framebuffer)` renders into the back of `framebuffers`, a
+    pair of e.g. render.Framebuffer, which then becomes the front.  `frame`
+    counts the frames completed so far.  With a `substepper` the steps per
+    frame follow real time instead of `steps_per_frame`.  If stepping or
+    drawing raises, the worker stops and `call`, `latest` and `check` raise
+    the error in the caller's thread.
+    """
+    def __init__(self, solver, draw, framebuffers, steps_per_frame=1,
+                 substepper=None):
+        self.solver = solver
+        self.draw = draw
+        self.framebuffers = list(framebuffers)
+        self.steps_per_frame = steps_per_frame
+        self.substepper = substepper
+        self.frame = 0
+        self._lock = threading.Lock()
+        self._calls = queue.SimpleQueue()
+        self._running = threading.Event()
+        self._thread = None
+        self.error = None  #what stopped the worker, if anything did
+
+    def start(self):
+        self._running.set()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Finish the current frame and stop."""
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def call(self, function, *args):
+        """Run `function(*args)` in the worker before the next frame."""
+        self.check()
+        self._calls.put((function, args))
+
+    def check(self):
+        """Raise the error the worker stopped on, if it did."""
+        if self.error is not None:
+            raise RuntimeError("the simulation thread failed") from self.error
+
+    def _run(self):
+        try:
+            self._loop()
+        except Exception as error:
+            self.error = error
+            self._running.clear()
+
+    def _loop(self):
+        last = time.perf_counter()
+        while self._running.is_set():
+            while True:
+                try:
+                    function, args = self._calls.get_nowait()
+                except queue.Empty:
+                    break
+                function(*args)
+
+            if self.substepper is None:
+                self.solver.step(self.steps_per_frame)
+            else:
+                now = time.perf_counter()
+                steps = self.substepper.run(self.solver, now - last)
+                last = now
+                if not steps:
+                    time.sleep(self.substepper.wait())
+                    continue
+            self.draw(self.solver, self.framebuffers[1])
+            with self._lock:
+                self.framebuffers.reverse()
+                self.frame += 1
+
+    @contextmanager
+    def latest(self):
+        """
+        The front framebuffer.  The worker won't swap buffers until the
+        block exits, so it's safe to read from.
+        """
+        self.check()
+        with self._lock:
+            yield self.framebuffers[0]
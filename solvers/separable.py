@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*
+"""
+Separable fast path for 2D convolutions.
+
+A general 3x3 `nd.convolve` costs 9 multiply-adds per cell, walking the
+kernel in n-d.  Most kernels here are far simpler: the diffusion kernels are
+a rank-1 outer product plus a multiple of the center cell, and the
+convective/poisson kernels are crosses, a 1D kernel along each axis.
+`decompose` finds such a form,
+
+    kernel = center * delta + sum of outer(column, row),
+
+and `convolve` applies it as 1D passes: `nd.convolve1d` along rows, and
+along columns weighted sums of row-shifted views of the field, since
+ndimage's 1D pass across rows strides through memory and is several times
+slower than one along them.  Kernels with no such form fall back to
+`nd.convolve`.  Decompositions are cached per kernel.
+
+ndimage accumulates each pass in double but rounds between passes, so
+results differ from `nd.convolve`'s in the last bit or so of the field's
+dtype.
+"""
+import numpy as np
+import scipy.ndimage as nd
+
+
+class Decomposition:
+    """`center` * delta + sum of outer(column, row) over `terms`."""
+    def __init__(self, kind, center, terms):
+        self.kind = kind
+        self.center = center
+        self.terms = terms
+
+
+def _delta(vector):
+    """The weight of `vector` if it's a multiple of the delta, else None."""
+    middle = len(vector) // 2
+    if np.count_nonzero(vector) == np.count_nonzero(vector[middle:middle + 1]):
+        return float(vector[middle])
+    return None
+
+def decompose(kernel, rtol=1e-12):
+    """A Decomposition of the 2D `kernel`, or None if it has none here."""
+    kernel = np.asarray(kernel, dtype=float)
+    if kernel.ndim != 2 or not all(side % 2 for side in kernel.shape):
+        return None
+    rows, cols = kernel.shape
+    cr, cc = rows // 2, cols // 2
+    atol = rtol * np.abs(kernel).max()
+    off_center = np.ones(kernel.shape, dtype=bool)
+    off_center[cr, cc] = False
+
+    #A rank-1 outer product, maybe plus a multiple of the center.  It's
+    #fixed by a row and a column through a pivot off the center's row and
+    #column, so it can't be thrown off by the center itself.
+    candidates = np.abs(kernel)
+    candidates[cr, :] = candidates[:, cc] = 0
+    if candidates.any():
+        i, j = np.unravel_index(np.argmax(candidates), kernel.shape)
+        column, row = kernel[:, j] / kernel[i, j], kernel[i, :]
+        outer = np.outer(column, row)
+        if np.allclose(outer[off_center], kernel[off_center], rtol=0,
+                       atol=atol):
+            center = float(kernel[cr, cc] - outer[cr, cc])
+            if abs(center) <= atol:
+                return Decomposition('rank-1', 0., [(column, row)])
+            return Decomposition('rank-1 + center', center, [(column, row)])
+        return None
+
+    #Nothing off the center row and column: a cross.
+    delta = np.zeros(rows)
+    delta[cr] = 1
+    across = np.zeros(cols)
+    across[cc] = 1
+    column = kernel[:, cc].copy()
+    column[cr] = 0
+    terms = [(column, row) for column, row in [(delta, kernel[cr, :]),
+                                                (column, across)]
+             if column.any() and row.any()]
+    return Decomposition('cross', 0., terms)
+
+_cache = {}
+
+def decomposition(kernel):
+    kernel = np.asarray(kernel, dtype=float)
+    key = kernel.shape, kernel.tobytes()
+    if key not in _cache:
+        _cache[key] = decompose(kernel)
+    return _cache[key]
+
+def _source_row(row, height, mode):
+    """
+    The row of a `height` row field that scipy's `mode` reads for `row`,
+    which may be outside of it, or None for a zero row.
+    """
+    if 0 <= row < height:
+        return row
+    if mode == 'wrap':
+        return row % height
+    if mode == 'constant':
+        return None
+    if mode == 'nearest':
+        return min(max(row, 0), height - 1)
+    if mode == 'reflect':
+        period = 2 * height
+        row %= period
+        return row if row < height else period - 1 - row
+    if mode == 'mirror':
+        if height == 1:
+            return 0
+        period = 2 * height - 2
+        row %= period
+        return row if row < height else period - row
+    raise ValueError("unknown boundary condition {!r}".format(mode))
+
+def convolve_rows(field, weights, mode, out):
+    """
+    `field` convolved with the 1D `weights` along axis -2 (across rows),
+    written into `out`.  Inside, each group of equal weights is a sum of
+    row-shifted views, scaled once; the `radius` rows at each end are
+    gathered row by row according to `mode`.
+    """
+    radius = len(weights) // 2
+    height = field.shape[-2]
+    groups = {}
+    for k, weight in enumerate(weights):
+        if weight:
+            groups.setdefault(float(weight), []).append(radius - k)
+    if not groups:
+        out[...] = 0
+        return out
+
+    #out[y] = sum of weight * field[y + shift], shift = radius - k, as
+    #convolution flips the kernel.
+    inner = out[..., radius:height - radius, :]
+    scratch = None
+    for i, (weight, shifts) in enumerate(groups.items() if inner.size
+                                         else ()):
+        if i == 0:
+            total = inner
+        else:
+            if scratch is None:
+                scratch = np.empty_like(inner)
+            total = scratch
+        views = [field[..., radius + shift:height - radius + shift, :]
+                 for shift in shifts]
+        if len(views) == 1:
+            np.copyto(total, views[0])
+        else:
+            np.add(views[0], views[1], out=total)
+        for view in views[2:]:
+            total += view
+        if weight != 1:
+            total *= weight
+        if i:
+            inner += total
+
+    edges = range(height) if not inner.size else\
+            list(range(radius)) + list(range(height - radius, height))
+    for y in edges:
+        row = out[..., y, :]
+        row[...] = 0
+        for weight, shifts in groups.items():
+            for shift in shifts:
+                source = _source_row(y + shift, height, mode)
+                if source is not None:
+                    row += weight * field[..., source, :]
+    return out
+
+def convolve(field, kernel, mode='reflect'):
+    """
+    `nd.convolve(field, kernel, mode=mode)` over the last two axes of
+    `field`, through the kernel's decomposition when it has one.
+    """
+    kernel = np.asarray(kernel)
+    decomposed = decomposition(kernel)
+    if decomposed is None:
+        kernel = kernel.reshape((1,) * (field.ndim - 2) + kernel.shape)
+        return nd.convolve(field, kernel.astype(field.dtype, copy=False),
+                           mode=mode)
+
+    out = None if decomposed.terms else np.zeros_like(field)
+    if decomposed.center:
+        out = field * decomposed.center
+    for column, row in decomposed.terms:
+        scale = _delta(row)
+        if scale is None:
+            term = nd.convolve1d(field, row, axis=-1, mode=mode)
+        else:
+            term = field * scale
+        scale = _delta(column)
+        if scale is None:
+            term = convolve_rows(term, column, mode, np.empty_like(term))
+        elif scale != 1:
+            term *= scale
+        if out is None:
+            out = term
+        else:
+            out += term
+    return out
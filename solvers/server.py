@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*
+"""
+Remote control and frame streaming for headless 2D Navier_Stokes runs.
+
+An asyncio server steps the solver and listens on a local TCP port (or a
+unix socket).  Clients send one JSON command per line:
+
+    {"command": "poke", "x": 40, "y": 60}      displace fluid at a cell
+    {"command": "wall", "x": 40, "y": 60}      paint a wall at a cell
+    {"command": "reset"}
+    {"command": "set", "name": "viscosity", "value": 0.02}
+    {"command": "save", "path": "run.ckpt"}    write a checkpoint
+    {"command": "subscribe"} / {"command": "unsubscribe"}
+    {"command": "status"}
+
+Coordinates are integer solver cells inside the grid.  Commands that touch
+the solver are queued and run between steps, all the pokes (and walls) queued
+by then in one batch.  The server answers with messages, each a kind byte and
+a 4 byte length (big endian) followed by the payload: REPLY, a JSON object,
+or FRAME, see `encode`.
+
+Subscribers get the field downsampled by `factor` (see render.downsample)
+and quantized to a byte per cell over [lo, hi], sent as the difference from
+the last frame that subscriber received, zlib compressed.  Each subscriber
+holds at most one pending frame: if it hasn't been sent when the next is
+ready, it's replaced (and counted as dropped), so a slow client only sees
+fewer frames and never holds up the step loop.
+
+Run from the repository root, e.g.:
+    python -m solvers.server --size 1024 1024 --factor 4 --port 8765
+"""
+import argparse
+import asyncio
+import json
+import struct
+import time
+import warnings
+import zlib
+
+import numpy as np
+from .checkpoint import PARAMETERS, save
+from .navier_stokes import NavierStokes
+from .render import downsample
+
+REPLY, FRAME = 0, 1
+HEADER = struct.Struct('>BI')  #message kind, payload length
+FRAME_HEADER = struct.Struct('>QIIB')  #steps, height, width, keyframe
+
+
+class Frame:
+    """A quantized, downsampled field and its encodings against others."""
+    def __init__(self, number, steps, values):
+        self.number = number
+        self.steps = steps
+        self.values = values
+        self._encoded = {}
+
+    def encode(self, base):
+        """
+        The FRAME payload: FRAME_HEADER then the zlib compressed bytes of
+        (values - base.values) mod 256, or of the values themselves, a
+        keyframe, if `base` is None.  Cached per base, as subscribers that
+        keep up all share the same one.
+        """
+        key = None if base is None else base.number
+        if key not in self._encoded:
+            if base is None:
+                data = self.values
+            else:
+                data = self.values - base.values  #uint8, wraps around
+            height, width = self.values.shape
+            self._encoded[key] = (FRAME_HEADER.pack(self.steps, height, width,
+                                                    base is None) +
+                                  zlib.compress(data.tobytes(), 1))
+        return self._encoded[key]
+
+
+class FrameDecoder:
+    """Rebuilds a client's frames: call it with each FRAME payload."""
+    def __init__(self):
+        self.values = None
+
+    def __call__(self, payload):
+        """(steps, values) of the frame in `payload`."""
+        steps, height, width, keyframe = FRAME_HEADER.unpack_from(payload)
+        data = np.frombuffer(zlib.decompress(payload[FRAME_HEADER.size:]),
+                             dtype=np.uint8).reshape(height, width)
+        if keyframe:
+            self.values = data.copy()
+        else:
+            self.values += data  #uint8, wraps around
+        return steps, self.values
+
+
+async def read_message(reader):
+    """(kind, payload) of the next message from the server."""
+    kind, length = HEADER.unpack(await reader.readexactly(HEADER.size))
+    return kind, await reader.readexactly(length)
+
+def message(kind, payload):
+    return HEADER.pack(kind, len(payload)) + payload
+
+
+class Subscriber:
+    def __init__(self, writer, closed):
+        self.writer = writer
+        self.closed = closed  #called with the writer once the client's gone
+        self.pending = None
+        self.last = None  #last frame sent
+        self.ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+
+    def offer(self, frame):
+        if self.pending is not None:
+            self.dropped += 1
+        self.pending = frame
+        self.ready.set()
+
+    async def send(self):
+        while True:
+            await self.ready.wait()
+            self.ready.clear()
+            frame, self.pending = self.pending, None
+            self.writer.write(message(FRAME, frame.encode(self.last)))
+            try:
+                await self.writer.drain()
+            except ConnectionError:
+                self.closed(self.writer)
+                return
+            self.last = frame
+            self.sent += 1
+
+
+class Server:
+    """
+    Steps `solver` `steps_per_frame` steps at a time, in a worker thread so
+    the event loop keeps serving, and streams `field` to subscribers at most
+    every `frame_interval` seconds.
+    """
+    def __init__(self, solver, factor=1, steps_per_frame=1, frame_interval=0.,
+                 field='pressure', lo=-1., hi=1.):
+        self.solver = solver
+        self.factor = factor
+        self.steps_per_frame = steps_per_frame
+        self.frame_interval = frame_interval
+        self.field = field
+        self.lo, self.hi = lo, hi
+        height, width = solver.shape
+        self._values = np.empty((height // factor, width // factor),
+                                dtype=np.float32)
+        self._calls = []
+        self._touches = {solver.poke: [], solver.add_wall: []}  #(x, y)s
+        self.subscribers = {}  #writer: Subscriber
+        self.frames = 0
+        self.running = False
+
+    def call(self, function, *args):
+        """Run `function(*args)` before the next step."""
+        self._calls.append((function, args))
+
+    def _touch(self, function, x, y):
+        """Queue `function` at (x, y), batched with the others of the step."""
+        touches = self._touches[function]
+        if not touches:
+            self.call(self._apply_touches, function)
+        touches.append((x, y))
+
+    def _apply_touches(self, function):
+        x, y = np.array(self._touches[function]).T
+        self._touches[function].clear()
+        function(x, y)
+
+    def _frame(self):
+        field = getattr(self.solver, self.field)
+        if self.solver.batch is not None:
+            field = field[0]  #the first member of an ensemble
+        values = downsample(field, self.factor, self._values)
+        values -= self.lo
+        values *= 255 / (self.hi - self.lo)
+        values += .5
+        np.clip(values, 0, 255, out=values)
+        np.nan_to_num(values, copy=False, nan=0.)
+        self.frames += 1
+        return Frame(self.frames, self.solver.steps, values.astype(np.uint8))
+
+    async def run(self):
+        """The step loop; runs until `running` is cleared."""
+        loop = asyncio.get_running_loop()
+        self.running = True
+        last_frame = 0.
+        while self.running:
+            calls, self._calls = self._calls, []
+            for function, args in calls:
+                try:
+                    function(*args)
+                except Exception as error:  #e.g. a bad checkpoint path
+                    #The client already got its reply; don't stop stepping.
+                    warnings.warn("{} failed: {!r}".format(
+                        getattr(function, '__name__', function), error),
+                        RuntimeWarning)
+            await loop.run_in_executor(None, self.solver.step,
+                                       self.steps_per_frame)
+
+            now = time.perf_counter()
+            if self.subscribers and now - last_frame >= self.frame_interval:
+                last_frame = now
+                frame = self._frame()
+                for subscriber in self.subscribers.values():
+                    subscriber.offer(frame)
+            await asyncio.sleep(0)
+
+    def _cell(self, command):
+        """The solver cell (x, y) of a poke or wall `command`."""
+        cell = command['x'], command['y']
+        for value, side in zip(cell, self.solver.size):
+            if not isinstance(value, int) or isinstance(value, bool):
+                raise ValueError("x and y must be integers")
+            if not 0 <= value < side:
+                raise ValueError("cell {} is outside of the {}x{} grid".format(
+                    cell, *self.solver.size))
+        return cell
+
+    def _status(self):
+        solver = self.solver
+        status = {'steps': solver.steps, 'size': list(solver.size),
+                  'factor': self.factor, 'frames': self.frames,
+                  'subscribers': [{'sent': subscriber.sent,
+                                   'dropped': subscriber.dropped}
+                                  for subscriber in self.subscribers.values()]}
+        status.update((name, np.ravel(getattr(solver, name)).tolist())
+                      for name in PARAMETERS)
+        return status
+
+    def _command(self, command, writer):
+        """Carry out `command`; returns the reply."""
+        solver = self.solver
+        if not isinstance(command, dict):
+            raise ValueError("commands are JSON objects")
+        name = command.get('command')
+        if name in ('poke', 'wall'):
+            function = solver.poke if name == 'poke' else solver.add_wall
+            self._touch(function, *self._cell(command))
+        elif name == 'reset':
+            self.call(solver.reset)
+        elif name == 'set':
+            if command['name'] not in PARAMETERS:
+                raise ValueError("can't set {!r}; one of {}".format(
+                    command['name'], ', '.join(PARAMETERS)))
+            value = np.asarray(command['value'], dtype=float)
+            if value.ndim and solver.batch is None or\
+               not np.isfinite(value).all():
+                raise ValueError("{} takes a number".format(command['name']))
+            value = solver._members(value if value.ndim else float(value))
+            self.call(setattr, solver, command['name'], value)
+        elif name == 'save':
+            if not isinstance(command['path'], str):
+                raise ValueError("path must be a string")
+            self.call(save, solver, command['path'])
+        elif name == 'subscribe':
+            if writer not in self.subscribers:
+                subscriber = self.subscribers[writer] = Subscriber(
+                    writer, self._unsubscribe)
+                subscriber.task = asyncio.ensure_future(subscriber.send())
+        elif name == 'unsubscribe':
+            self._unsubscribe(writer)
+        elif name == 'status':
+            return self._status()
+        else:
+            raise ValueError("unknown command {!r}".format(name))
+        return {'ok': True}
+
+    def _unsubscribe(self, writer):
+        subscriber = self.subscribers.pop(writer, None)
+        if subscriber is not None:
+            subscriber.task.cancel()
+
+    async def _client(self, reader, writer):
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    reply = self._command(json.loads(line), writer)
+                except (ValueError, KeyError, TypeError) as error:
+                    reply = {'error': str(error)}
+                writer.write(message(REPLY, json.dumps(reply).encode()))
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            self._unsubscribe(writer)
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8765, path=None):
+        """Listen on `host`:`port`, or the unix socket `path`, and step."""
+        if path is None:
+            server = await asyncio.start_server(self._client, host, port)
+        else:
+            server = await asyncio.start_unix_server(self._client, path)
+        async with server:
+            await self.run()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--size', type=int, nargs=2, default=[256, 256],
+                        metavar=('WIDTH', 'HEIGHT'))
+    parser.add_argument('--bc', default='wrap')
+    parser.add_argument('--backend', default='fused')
+    parser.add_argument('--pressure-solver', default='relax')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help='listen on this unix socket instead')
+    parser.add_argument('--factor', type=int, default=1,
+                        help='downsampling of streamed frames')
+    parser.add_argument('--steps-per-frame', type=int, default=1)
+    parser.add_argument('--fps', type=float, default=60,
+                        help='most frames per second streamed; 0 for no limit')
+    args = parser.parse_args()
+
+    solver = NavierStokes(args.size, bc=args.bc, backend=args.backend,
+                          pressure_solver=args.pressure_solver)
+    server = Server(solver, args.factor, args.steps_per_frame,
+                    1 / args.fps if args.fps else 0.)
+    try:
+        asyncio.run(server.serve(args.host, args.port, args.unix))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        solver.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*
+"""
+Stencil programs: the pre_navier_stokes equations written down once as sums
+of terms, and one hot path that steps them all.  The equations themselves
+are at the bottom.
+
+A Program is the update u <- sum of terms + constant, where a Term is a
+coefficient times a product of factors, each either the field itself (`U`)
+or a Stencil of it -- the field convolved, with wrap-around edges, with a
+kernel.  E.g. Burgers' equation is
+
+    Program(Term('con_constant', U, Stencil(CONVECTION)),
+            Term(1, Stencil(SMOOTHING)))
+
+A coefficient is a number or the name of an attribute of the solver, read
+every step.  A Stencil holds a kernel per number of dimensions, so the same
+program steps a 1D or a 2D field.
+
+`Program.compile(shape, dtype)` lowers it for one grid: every kernel becomes
+groups of equally weighted offsets, evaluated as sums of shifted views of a
+halo-padded buffer, and the buffers and temporaries are allocated once.  A
+step then allocates nothing.  Compiled programs keep state, so each solver
+compiles its own.
+"""
+import numpy as np
+
+U = 'u'  #the field itself, as a factor
+
+
+class Stencil:
+    """
+    The field convolved with `kernel`: an array, or a dict of arrays by
+    number of dimensions.
+    """
+    def __init__(self, kernel):
+        self.kernel = kernel
+
+    def kernel_for(self, ndim):
+        kernel = self.kernel
+        if isinstance(kernel, dict):
+            if ndim not in kernel:
+                raise ValueError("no {}D kernel for this stencil".format(ndim))
+            kernel = kernel[ndim]
+        kernel = np.asarray(kernel, dtype=float)
+        if kernel.ndim != ndim:
+            raise ValueError("a {}D kernel can't step a {}D field".format(
+                kernel.ndim, ndim))
+        return kernel
+
+
+class Term:
+    """`coefficient` times the product of `factors`."""
+    def __init__(self, coefficient, *factors):
+        self.coefficient = coefficient
+        self.factors = factors
+
+
+class Program:
+    """u <- sum of `terms` + `constant`."""
+    def __init__(self, *terms, constant=0.):
+        self.terms = terms
+        self.constant = constant
+
+    def compile(self, shape, dtype):
+        return CompiledProgram(self, shape, dtype)
+
+
+def offsets(kernel):
+    """
+    The kernel as [(weight, [offset, ...]), ...], zero weights dropped and
+    equal weights grouped, so each group costs one multiply.  Offsets are
+    where convolution reads from relative to the output cell.
+    """
+    center = np.array(kernel.shape) // 2
+    groups = {}
+    for index in zip(*np.nonzero(kernel)):
+        offset = tuple(center - index)  #convolution flips the kernel
+        groups.setdefault(float(kernel[index]), []).append(offset)
+    return sorted(groups.items())
+
+def fill_wrap(padded, radius):
+    """Fill the `radius` cell halo of `padded` by wrapping the interior."""
+    if not radius:
+        return
+    r = radius
+    for axis in range(padded.ndim):
+        head = [slice(None)] * padded.ndim
+        tail = [slice(None)] * padded.ndim
+        head[axis], tail[axis] = slice(0, r), slice(-2 * r, -r)
+        padded[tuple(head)] = padded[tuple(tail)]
+        head[axis], tail[axis] = slice(-r, None), slice(r, 2 * r)
+        padded[tuple(head)] = padded[tuple(tail)]
+
+
+class CompiledProgram:
+    """
+    A Program lowered for fields of `shape` and `dtype`.  `step` returns the
+    next field as a view of one of two padded buffers; stepping that view
+    again skips copying it in, so writes to it (pokes) carry over.
+    """
+    def __init__(self, program, shape, dtype):
+        self.program = program
+        ndim = len(shape)
+        stencils = [factor for term in program.terms
+                    for factor in term.factors if factor is not U]
+        self.groups = {stencil: offsets(stencil.kernel_for(ndim))
+                       for stencil in stencils}
+        self.radius = max([abs(offset) for groups in self.groups.values()
+                           for _, group in groups for offset in
+                           np.ravel(group)] + [0])
+        r = self.radius
+        padded_shape = tuple(side + 2 * r for side in shape)
+        self.buffers = [np.zeros(padded_shape, dtype=dtype) for _ in range(2)]
+        self.interior = tuple(slice(r, r + side) for side in shape)
+        #term product, stencil result, stencil group sum
+        self.tmp = [np.empty(shape, dtype=dtype) for _ in range(3)]
+        self.u = self.buffers[0][self.interior]
+
+    def _view(self, offset):
+        padded = self.buffers[0]
+        return padded[tuple(slice(s.start + o, s.stop + o)
+                            for s, o in zip(self.interior, offset))]
+
+    def _stencil(self, stencil, out):
+        scratch = self.tmp[2]
+        for i, (weight, group) in enumerate(self.groups[stencil]):
+            total = out if i == 0 else scratch
+            if len(group) == 1:
+                np.copyto(total, self._view(group[0]))
+            else:
+                np.add(self._view(group[0]), self._view(group[1]), out=total)
+            for offset in group[2:]:
+                total += self._view(offset)
+            if weight != 1:
+                total *= weight
+            if i:
+                out += total
+        return out
+
+    def _term(self, term, solver, out):
+        coefficient = term.coefficient
+        if isinstance(coefficient, str):
+            coefficient = getattr(solver, coefficient)
+        product = self.tmp[1]
+        for i, factor in enumerate(term.factors):
+            if factor is U:
+                value = self.u
+            else:
+                value = self._stencil(factor, out if i == 0 else product)
+            if i == 0:
+                if coefficient != 1 or value is not out:
+                    np.multiply(value, coefficient, out=out)
+            else:
+                out *= value
+        return out
+
+    def step(self, u, solver):
+        """The field after one step from `u`, with `solver`'s coefficients."""
+        if u is not self.u:
+            self.u[...] = u
+        fill_wrap(self.buffers[0], self.radius)
+
+        out = self.buffers[1][self.interior]
+        for i, term in enumerate(self.program.terms):
+            if i == 0:
+                self._term(term, solver, out)
+            else:
+                out += self._term(term, solver, self.tmp[0])
+        if self.program.constant:
+            out += self.program.constant
+
+        self.buffers.reverse()
+        self.u = out
+        return out
+
+
+#The pre_navier_stokes equations.  Kernels are by number of dimensions.
+AVERAGE = {1: [.5, 0, .5],
+           2: [[0, .25, 0], [.25, 0, .25], [0, .25, 0]]}
+CONVECTION = {1: [.5, -1, .5],
+              2: [[0, .25, 0], [.25, -1, .25], [0, .25, 0]]}
+SMOOTHING = {1: [.25, .5, .25],
+             2: [[.025, .1, .025], [.1, .5, .1], [.025, .1, .025]]}
+ADVECTION = {1: [0, -1, 1],
+             2: CONVECTION[2]}
+
+def diffusion(kernel):
+    return Program(Term('damping', Stencil(kernel)))
+
+BURGERS = Program(Term('con_constant', U, Stencil(CONVECTION)),
+                  Term(1, Stencil(SMOOTHING)))
+NONLINEAR_CONVECTION = Program(Term(1, U), Term(1, U, Stencil(ADVECTION)))
+LAPLACE = Program(Term(1, Stencil(AVERAGE)))
+#Just laplace with a relaxing term
+POISSON = Program(Term(1, Stencil(AVERAGE)), constant=-.01)
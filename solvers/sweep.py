@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*
+"""
+Headless parameter sweeps of the 2D Navier_Stokes solver.
+
+Every combination of the given parameter values is run in a process pool.
+Workers write their final fields and diagnostics into shared memory blocks
+allocated by the parent instead of pickling the arrays back.
+
+Run from the repository root, e.g.:
+    python -m solvers.sweep --viscosity .01 .018 .03 --rho 1 1.06 \\
+        --bc wrap reflect --texture-dim 256 512 --steps 2000 --output sweep.npz
+"""
+import argparse
+import inspect
+import itertools
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+from .navier_stokes import NavierStokes
+
+DIAGNOSTICS = 'max_momentum', 'max_pressure', 'mean_pressure', 'energy'
+DEFAULTS = {name: parameter.default for name, parameter in
+            inspect.signature(NavierStokes).parameters.items()}
+
+
+def grid(**values):
+    """Every combination of the given parameter values, as keyword dicts."""
+    names = list(values)
+    return [dict(zip(names, combination))
+            for combination in itertools.product(*values.values())]
+
+def layout(config):
+    """
+    (shape, dtype) of the fields of a NavierStokes built from `config`,
+    without building it.
+    """
+    config = dict(DEFAULTS, **config)
+    width, height = config['size']
+    shape = (height, width)
+    if config['batch'] is not None:
+        shape = (config['batch'],) + shape
+    return shape, np.dtype(config['storage'] or config['dtype'])
+
+def diagnostics(solver):
+    return (np.abs(solver.momentum).max(), np.abs(solver.pressure).max(),
+            solver.pressure.mean(), np.square(solver.momentum).sum())
+
+
+class SharedResult:
+    """
+    Final momentum and pressure (of `shape` and `dtype`) and diagnostics of
+    one run, laid out in a single shared memory block.  Created by the parent
+    (name=None), attached to by name in the worker.
+    """
+    def __init__(self, shape, dtype=np.float32, name=None):
+        dtype = np.dtype(dtype)
+        cells = int(np.prod(shape))
+        #float64 diagnostics first, so the fields after them stay aligned.
+        offset = len(DIAGNOSTICS) * np.dtype(np.float64).itemsize
+        size = offset + 2 * cells * dtype.itemsize
+        self.shm = SharedMemory(name=name, create=name is None, size=size)
+        self.diagnostics = np.ndarray(len(DIAGNOSTICS), dtype=np.float64,
+                                      buffer=self.shm.buf)
+        fields = np.ndarray(2 * cells, dtype=dtype, buffer=self.shm.buf,
+                            offset=offset)
+        self.momentum = fields[:cells].reshape(shape)
+        self.pressure = fields[cells:].reshape(shape)
+        self.elapsed = None
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def close(self):
+        #The views have to go before the block can be closed.
+        del self.momentum, self.pressure, self.diagnostics
+        self.shm.close()
+
+    def release(self):
+        """Close and free the block; only the parent should do this."""
+        self.close()
+        self.shm.unlink()
+
+
+def _run(config, steps, name, backend):
+    solver = NavierStokes(backend=backend, **config)
+    result = SharedResult(*layout(config), name=name)
+    try:
+        start = time.perf_counter()
+        solver.step(steps)
+        elapsed = time.perf_counter() - start
+        result.momentum[:] = solver.momentum
+        result.pressure[:] = solver.pressure
+        result.diagnostics[:] = diagnostics(solver)
+    finally:
+        result.close()
+    return elapsed
+
+def sweep(configs, steps, workers=None, backend='fused'):
+    """
+    Run each config (NavierStokes keyword arguments) for `steps` steps across
+    a pool of `workers` processes.  Returns a SharedResult per config; call
+    `release` on each when done with it.
+    """
+    results = [SharedResult(*layout(config)) for config in configs]
+    try:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [pool.submit(_run, config, steps, result.name, backend)
+                       for config, result in zip(configs, results)]
+            for result, future in zip(results, futures):
+                result.elapsed = future.result()
+    except BaseException:
+        for result in results:
+            result.release()
+        raise
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--viscosity', type=float, nargs='+', default=[.018])
+    parser.add_argument('--rho', type=float, nargs='+', default=[1.06])
+    parser.add_argument('--damping', type=float, nargs='+', default=[.994])
+    parser.add_argument('--external-flow', type=float, nargs='+', default=[.4])
+    parser.add_argument('--bc', nargs='+', default=['wrap'])
+    parser.add_argument('--texture-dim', type=int, nargs='+', default=[256],
+                        help='side lengths of square grids')
+    parser.add_argument('--steps', type=int, default=1000)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--backend', default='fused')
+    parser.add_argument('--output', help='save fields and diagnostics to '
+                                         'this .npz file')
+    args = parser.parse_args()
+
+    configs = grid(viscosity=args.viscosity, rho=args.rho,
+                   damping=args.damping, external_flow=args.external_flow,
+                   bc=args.bc, size=[(dim, dim) for dim in args.texture_dim])
+    results = sweep(configs, args.steps, args.workers, args.backend)
+    try:
+        print(' '.join('{:>13}'.format(column) for column in
+                       list(configs[0]) + list(DIAGNOSTICS) + ['steps/sec']))
+        for config, result in zip(configs, results):
+            values = [str(value) for value in config.values()]
+            values += ['{:.4g}'.format(value) for value in result.diagnostics]
+            values.append('{:.1f}'.format(args.steps / result.elapsed))
+            print(' '.join('{:>13}'.format(value) for value in values))
+
+        if args.output:
+            arrays = {}
+            for i, result in enumerate(results):
+                arrays['momentum_{}'.format(i)] = result.momentum
+                arrays['pressure_{}'.format(i)] = result.pressure
+            np.savez(args.output, configs=np.array(configs, dtype=object),
+                     diagnostics=np.array([result.diagnostics
+                                           for result in results]),
+                     **arrays)
+    finally:
+        for result in results:
+            result.release()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*
+"""
+Active-tile backend: only step the parts of the grid where something is
+happening.
+
+Most of a typical run is still water until it's poked.  The grid is cut into
+`tile` x `tile` tiles, and at the start of every step a tile is active if any
+cell of its momentum or pressure is above `threshold` in magnitude.  The
+fused stages then run only over the active tiles plus a one tile border --
+far enough for anything to spread in one step, as each of the three stages
+reaches one cell.  Every other tile is dead: its cells are zero in all the
+buffers and stay zero, which is what a full step would leave there.
+
+With threshold=0 a step is identical to the 'fused' backend's.  A positive
+threshold also zeros tiles whose fields have decayed below it, trading a
+little accuracy for letting calm regions go back to sleep.  Use it as
+    NavierStokes(size, backend='tiled')
+or, to pick the tile size and threshold,
+    NavierStokes(size, backend=partial(TiledBackend, tile=64, threshold=1e-6))
+Only the 'relax' pressure update is supported.
+"""
+import numpy as np
+from .backends import (FusedBackend, fill_halo, flow_stage, interior,
+                       momentum_stage, pressure_stage)
+
+HALO = 3  #one cell per stage
+
+
+def tile_starts(length, tile):
+    """
+    First cell of each tile along an axis of `length` cells.  A remainder
+    narrower than HALO joins the last whole tile, so a one tile border always
+    covers how far a step reaches.
+    """
+    starts = np.arange(0, length, tile)
+    if len(starts) > 1 and length - starts[-1] < HALO:
+        starts = starts[:-1]
+    return starts
+
+def grow(active, wrap):
+    """`active` and its 8 neighbors, wrapping around the edges if `wrap`."""
+    grown = active.copy()
+    for axis in (0, 1):
+        before = grown.copy()
+        if wrap:
+            grown |= np.roll(before, 1, axis)
+            grown |= np.roll(before, -1, axis)
+        else:
+            head = [slice(None)] * 2
+            tail = [slice(None)] * 2
+            head[axis], tail[axis] = slice(1, None), slice(None, -1)
+            grown[tuple(head)] |= before[tuple(tail)]
+            grown[tuple(tail)] |= before[tuple(head)]
+    return grown
+
+
+class TiledBackend(FusedBackend):
+    """
+    Fused stages over the active tiles only.  `updated` is the (tile rows,
+    tile cols) mask of the tiles stepped by the last step.
+    """
+    def __init__(self, solver, tile=32, threshold=0.):
+        if solver._pressure_solver is not None:
+            raise ValueError("the tiled backend only supports the 'relax' "
+                             "pressure update")
+        if tile < HALO:
+            raise ValueError("tiles must be at least {} cells".format(HALO))
+        height, width = solver.shape
+        self.tile = tile
+        self.threshold = threshold
+        self.row_starts = tile_starts(height, tile)
+        self.col_starts = tile_starts(width, tile)
+        self.row_edges = np.append(self.row_starts, height)
+        self.col_edges = np.append(self.col_starts, width)
+        self.updated = None
+        super().__init__(solver)
+
+    def _bind(self, solver):
+        super()._bind(solver)
+        #Nothing is known about what's outside the new fields' active tiles.
+        self.updated = None
+
+    def _activity(self, field):
+        """Whether each tile of `field` has a cell above the threshold."""
+        magnitude = np.abs(field, out=self.tmp[0])
+        if magnitude.ndim > 2:
+            magnitude = magnitude.max(axis=tuple(range(magnitude.ndim - 2)))
+        #Whole tiles of rows reduce as one (tiles, tile, width) view, far
+        #faster than reduceat along the first axis; the last tile may differ.
+        last = self.row_starts[-1]
+        peaks = np.empty((len(self.row_starts), magnitude.shape[1]),
+                         dtype=magnitude.dtype)
+        np.max(magnitude[:last].reshape(-1, self.tile, magnitude.shape[1]),
+               axis=1, out=peaks[:-1])
+        np.max(magnitude[last:], axis=0, out=peaks[-1])
+        peaks = np.maximum.reduceat(peaks, self.col_starts, axis=1)
+        return ~(peaks <= self.threshold)  #NaNs, too, are activity
+
+    def _windows(self, tiles):
+        """
+        (row_start, row_stop, col_start, col_stop) windows covering `tiles`:
+        each run of neighboring tiles in a row of tiles, merged with the same
+        run in the rows below, as every window costs a few dozen numpy calls
+        per stage.
+        """
+        windows = []
+        open_runs = {}  #(first col, stop col) of a run: its first row
+        for i, row in enumerate(tiles):
+            padded = np.concatenate(([False], row, [False]))
+            changes = np.flatnonzero(padded[1:] != padded[:-1])
+            runs = set(zip(changes[0::2], changes[1::2]))
+            for run in set(open_runs) - runs:
+                windows.append(self._window(open_runs.pop(run), i, *run))
+            for run in runs - set(open_runs):
+                open_runs[run] = i
+        for run, first in open_runs.items():
+            windows.append(self._window(first, len(tiles), *run))
+        return windows
+
+    def _window(self, first_row, stop_row, first_col, stop_col):
+        return (self.row_edges[first_row], self.row_edges[stop_row],
+                self.col_edges[first_col], self.col_edges[stop_col])
+
+    def _clear(self, tiles):
+        """Zero `tiles` in every buffer."""
+        buffers = self.m, self.p, self.a, self.q
+        for r0, r1, c0, c1 in self._windows(tiles):
+            for buffer in buffers:
+                interior(buffer)[..., r0:r1, c0:c1] = 0
+
+    def step(self, solver):
+        if solver.momentum is not self.momentum or\
+           solver.pressure is not self.pressure:
+            self._bind(solver)
+
+        bc = solver.bc
+        rho = solver.rho
+        damping = solver.damping
+        external_flow = solver.external_flow
+
+        with solver.stage('tiles'):
+            active = (self._activity(interior(self.m)) |
+                      self._activity(interior(self.p)))
+            updated = grow(active, bc == 'wrap')
+            #Tiles that just died, or all of them after a rebind, may hold
+            #stale or below-threshold values.
+            previous = True if self.updated is None else self.updated
+            self._clear(previous & ~updated)
+            self.updated = updated
+            windows = self._windows(updated)
+
+        with solver.stage('momentum'):
+            fill_halo(self.m, bc)
+            fill_halo(self.p, bc)
+            for window in windows:
+                momentum_stage(self.m, self.p, self.a, self.tmp, window,
+                               solver.viscosity, rho, damping)
+
+        with solver.stage('flow'):
+            if np.any(external_flow):
+                fill_halo(self.a, bc)
+                for window in windows:
+                    flow_stage(self.a, self.m, window, external_flow)
+            else:
+                self.m, self.a = self.a, self.m
+
+        with solver.stage('pressure'):
+            fill_halo(self.m, bc)
+            for window in windows:
+                pressure_stage(self.m, self.p, self.q, self.tmp, window, rho,
+                               damping)
+            self.p, self.q = self.q, self.p
+
+        #Wall boundary conditions
+        with solver.stage('walls'):
+            walls = solver.wall_index
+            walls.fill(interior(self.m), -external_flow)
+            walls.fill(interior(self.p), 0)
+
+        self._publish(solver)
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*
+"""
+Headless 2D solvers for the pre_navier_stokes demos.
+"""
+import numpy as np
+from .stencil import (BURGERS, LAPLACE, NONLINEAR_CONVECTION, POISSON,
+                      diffusion)
+
+
+class Equation2D:
+    """
+    A 2D field `u` of `dtype`.  `size` is (width, height) like a texture
+    size; `u` has shape (height, width).  Subclasses set `program`, a
+    stencil.Program.  `hooks` are called with the solver after every step.
+    """
+    fields = 'u',
+    program = None
+
+    def __init__(self, size=(256, 256), dtype=np.float32):
+        self.size = list(size)
+        self.dtype = np.dtype(dtype)
+        self.hooks = []
+        self._compiled = None
+        self.reset()
+
+    @property
+    def shape(self):
+        return self.size[1], self.size[0]
+
+    def reset(self):
+        size = self.size
+        self.u = np.zeros(self.shape, dtype=self.dtype)
+        self.u[size[0] // 4 : 3 * size[0] // 4,
+               size[1] // 4 : 3 * size[1] // 5] = 1
+        self.steps = 0
+
+    def step(self, n=1):
+        for _ in range(n):
+            self._step()
+            self.steps += 1
+            for hook in self.hooks:
+                hook(self)
+        return self
+
+    def _step(self):
+        if self._compiled is None:
+            self._compiled = self.program.compile(self.shape, self.dtype)
+        self.u = self._compiled.step(self.u, self)
+
+    def poke(self, x, y):
+        """Set the cells around (x, y) to 1."""
+        self.u[y - 5:y + 6, x - 5:x + 6] = 1
+
+
+class Burgers2D(Equation2D):
+    program = BURGERS
+    con_constant = .74  #convection constant
+
+
+class Convection2D(Equation2D):
+    program = LAPLACE  #the same averaging
+
+
+class Diffusion2D(Equation2D):
+    kernel = np.array([[.05, .2, .05], [.2, 0, .2], [.05, .2, .05]])
+    program = diffusion(kernel)
+    damping = 1.
+
+
+class Laplace2D(Equation2D):
+    program = LAPLACE
+
+
+class NonlinearConvection2D(Equation2D):
+    program = NONLINEAR_CONVECTION
+
+
+class Poisson2D(Equation2D):
+    program = POISSON
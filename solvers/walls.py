@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*
+"""
+Sparse index of the wall cells of the 2D Navier_Stokes solver.
+
+The solver keeps its dense float32 `walls` field, but every step only needs
+to touch the cells that are walls, usually none or a few hundred.  WallIndex
+keeps their flat indices sorted, grows them as walls are painted, and writes
+boundary values and wall colors through them, so both cost O(wall cells)
+rather than O(grid).
+"""
+import numpy as np
+
+
+class WallIndex:
+    """
+    Sorted flat indices (`cells`) of the cells of `walls` that equal 1.
+    `index` is the same cells as a tuple of index arrays, one per axis of the
+    field, so it works on strided views of the fields, e.g. the interior of
+    a padded buffer.  `cells` is replaced, never modified, whenever it
+    changes, so consumers can cache derived data on its identity.  Pass
+    `cells` when they're already known to skip scanning `walls`.
+    """
+    def __init__(self, walls, cells=None):
+        self.walls = walls
+        self.shape = walls.shape
+        self.cells = self._scan(walls) if cells is None else cells
+        self._index = None
+
+    @staticmethod
+    def _scan(walls, rows=1024):
+        """
+        flatnonzero(walls == 1), a block of rows at a time, so scanning a
+        memory-mapped grid doesn't need a grid-sized temporary.
+        """
+        if walls.ndim < 2:
+            return np.flatnonzero(walls == 1)
+        walls = walls.reshape(-1, walls.shape[-1])
+        width = walls.shape[1]
+        cells = [np.flatnonzero(walls[start:start + rows] == 1) + start * width
+                 for start in range(0, len(walls), rows)]
+        return np.concatenate(cells) if cells else np.empty(0, dtype=np.intp)
+
+    def moved(self, walls):
+        """
+        Index `walls`, an identical copy of the walls indexed so far, e.g. in
+        another kind of memory, without scanning it again.
+        """
+        if walls.shape != self.shape:
+            raise ValueError("walls moved to a different shape")
+        self.walls = walls
+
+    def __len__(self):
+        return len(self.cells)
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = np.unravel_index(self.cells, self.shape)
+        return self._index
+
+    def add(self, index):
+        """Add the cells at `index`, a tuple of index arrays, to the walls."""
+        cells = np.ravel_multi_index(index, self.shape)
+        cells = np.union1d(self.cells, cells)
+        if len(cells) != len(self.cells):
+            self.cells, self._index = cells, None
+
+    def fill(self, field, value):
+        """
+        Set the wall cells of `field` to `value`, a scalar or an array that
+        broadcasts against the field, e.g. a (batch, 1, 1) parameter.
+        """
+        if not len(self.cells):
+            return
+        if np.ndim(value):
+            value = np.broadcast_to(value, self.shape)[self.index]
+        field[self.index] = value